@@ -0,0 +1,339 @@
+"""
+Headless batch analysis.  Streams whole videos through an in-process detector
+and writes the peaks of every frame (and optionally the heatmaps) to disk:
+
+    flysight-batch --output results/ 'archive/**/*.mp4'
+
+For every video the output directory receives, under `<stem>`, the path of
+the video relative to the directory common to all of the videos, without its
+extension:
+
+    <stem>.peaks.csv        frame,peak,row,col (pixels in the frame)
+    <stem>.heatmaps.npy     [frames, 512, 512] float16 (with --heatmaps), or
+                            [frames, rows, cols] for frames evaluated as
+                            tiles (see `model.tiling`)
+    <stem>.checkpoint.json  progress, used to resume an interrupted run
+
+Decoding, inference and peak finding run as overlapped pipeline stages joined
+by bounded queues.
+"""
+import glob
+import json
+import sys
+import time
+from argparse import ArgumentParser
+from os import makedirs, replace
+from os.path import (
+        abspath, commonpath, dirname, exists, isdir, join, relpath,
+        splitext)
+from queue import Queue
+from threading import Thread
+import numpy as np
+from flysight.config import Config
+from flysight.server.backend import Backend
+from flysight.server.solver import FlyCentroidDetector
+from flysight.video import VideoReader
+
+# Marks the end of the stream in a queue.
+END = None
+
+
+def main(argv=None):
+    argp = ArgumentParser(description='Headless batch analysis of videos.')
+    argp.add_argument(
+            'videos',
+            nargs='+',
+            help='Video files or glob patterns.')
+    argp.add_argument(
+            '--output',
+            required=True)
+    argp.add_argument(
+            '--config',
+            default=None)
+    argp.add_argument(
+            '--heatmaps',
+            action='store_true',
+            help='Also store the native heatmap of every frame.')
+    argp.add_argument(
+            '--batch-size',
+            type=int,
+            default=8)
+    argp.add_argument(
+            '--checkpoint-every',
+            type=int,
+            default=500,
+            help='Frames between checkpoints.')
+    argp.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore existing checkpoints.')
+
+    args = argp.parse_args(argv)
+
+    path = args.config or join(dirname(__file__), 'config.yml')
+    Config.Load(path)
+
+    videos = []
+    for pattern in args.videos:
+        videos.extend(sorted(glob.glob(pattern, recursive=True)) or [pattern])
+
+    makedirs(args.output, exist_ok=True)
+    detector = FlyCentroidDetector()
+
+    for (video, stem) in zip(videos, output_stems(videos)):
+        BatchJob(video, join(args.output, stem), detector, args).run()
+
+
+def output_stems(videos: [str]) -> [str]:
+    """
+    The paths of the videos relative to their common directory, without their
+    extension, so that videos of the same name in different directories do
+    not share their outputs.
+    """
+    paths = [abspath(video) for video in videos]
+    if not paths:
+        return []
+
+    root = commonpath(paths)
+    if not isdir(root):
+        root = dirname(root)
+
+    return [splitext(relpath(path, root))[0] for path in paths]
+
+
+class BatchJob:
+    """
+    :class BatchJob:
+
+    Processing of a single video.
+    """
+    def __init__(self, video: str, stem: str, detector: FlyCentroidDetector,
+                 args):
+        """
+        The outputs are written to `stem` suffixed by their kind.
+        """
+        self.video = video
+        self.detector = detector
+        self.batch_size = args.batch_size
+        self.checkpoint_every = args.checkpoint_every
+
+        makedirs(dirname(stem) or '.', exist_ok=True)
+        self.peaks_path = stem + '.peaks.csv'
+        self.heatmaps_path = stem + '.heatmaps.npy' if args.heatmaps else None
+        self.checkpoint_path = stem + '.checkpoint.json'
+
+        reader = VideoReader.Open(video)
+        self.frame_count = reader.frame_count
+        self.rows = reader.rows
+        self.cols = reader.cols
+        reader.close()
+
+        self.start = 0
+        if not args.restart and exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as fp:
+                checkpoint = json.load(fp)
+
+            # A checkpoint of another video is started over.
+            if checkpoint.get('video') == abspath(video):
+                self.start = checkpoint['frames']
+            else:
+                print('{}: ignoring the checkpoint of {}'.format(
+                        video, checkpoint.get('video')), file=sys.stderr)
+
+    def run(self):
+        if self.start >= self.frame_count:
+            print('{}: already complete'.format(self.video), file=sys.stderr)
+            return
+
+        frames = Queue(maxsize=4 * self.batch_size)
+        heatmaps = Queue(maxsize=4)
+
+        stages = [
+            Thread(target=self.decode, args=(frames, )),
+            Thread(target=self.infer, args=(frames, heatmaps)),
+        ]
+        for stage in stages:
+            stage.daemon = True
+            stage.start()
+
+        # Peak finding and writing happen on this thread.
+        self.write(heatmaps)
+
+        for stage in stages:
+            stage.join()
+
+    def decode(self, frames: Queue):
+        """
+        Stage 1; decode grayscale frames starting at the checkpoint.
+        """
+        reader = VideoReader.Open(self.video)
+
+        # Only the first read seeks.
+        frame_idx = self.start
+        while True:
+            image = reader.read(frame_idx)
+            if image is None:
+                break
+
+            frames.put((frame_idx, image))
+            frame_idx += 1
+
+        reader.close()
+        frames.put(END)
+
+    def infer(self, frames: Queue, heatmaps: Queue):
+        """
+        Stage 2; evaluate the frames in batches.  Whatever has been decoded is
+        taken, up to the batch size, so the stage never waits on a full batch.
+        """
+        done = False
+        while not done:
+            batch = [frames.get()]
+            while len(batch) < self.batch_size and not frames.empty():
+                batch.append(frames.get())
+
+            if batch[-1] is END:
+                batch.pop()
+                done = True
+
+            if batch:
+                (indices, images) = zip(*batch)
+                heatmaps.put((indices,
+                              self.detector.generate_heatmaps(list(images))))
+
+        heatmaps.put(END)
+
+    def write(self, heatmaps: Queue):
+        """
+        Stage 3; find the peaks and write the results, checkpointing as it
+        goes.
+        """
+        resume = self.start > 0
+        peaks_file = self.open_peaks(resume)
+
+        store = None
+        if self.heatmaps_path:
+            shape = (self.frame_count, ) + self.heatmap_dim()
+            if resume and exists(self.heatmaps_path):
+                store = np.load(self.heatmaps_path, mmap_mode='r+')
+                if store.shape != shape:
+                    raise ValueError(
+                            '{} holds heatmaps of shape {} rather than {}, '
+                            'use --restart'.format(self.heatmaps_path,
+                                                   store.shape, shape))
+            else:
+                store = np.lib.format.open_memmap(
+                            self.heatmaps_path, mode='w+', dtype=np.float16,
+                            shape=shape)
+
+        scale = np.array([self.rows, self.cols], dtype=np.float64)
+        progress = Progress(self.video, self.start, self.frame_count)
+        frames = self.start
+
+        while True:
+            item = heatmaps.get()
+            if item is END:
+                break
+
+            for (frame_idx, heatmap) in zip(*item):
+                peaks = self.detector.find_peaks(heatmap) * scale
+                for (peak_idx, (row, col)) in enumerate(peaks):
+                    peaks_file.write('{},{},{:.2f},{:.2f}\n'.format(
+                                        frame_idx, peak_idx, row, col))
+
+                if store is not None and frame_idx < len(store):
+                    store[frame_idx] = heatmap[:, :, 0]
+
+                frames = frame_idx + 1
+                if frames % self.checkpoint_every == 0:
+                    self.checkpoint(frames, peaks_file, store)
+
+            progress.update(frames)
+
+        self.checkpoint(frames, peaks_file, store)
+        peaks_file.close()
+        progress.finish(frames)
+
+    def heatmap_dim(self) -> (int, int):
+        """
+        The dimensions of the heatmaps of the video; those of the frames when
+        they are evaluated as tiles (see `model.tiling`), otherwise those of
+        the model.
+        """
+        tiling = Config.Instance.model.tiling
+        if tiling.enabled and max(self.rows, self.cols) > tiling.size:
+            return (self.rows, self.cols)
+
+        return tuple(Backend.INPUT_DIM)
+
+    def open_peaks(self, resume: bool):
+        """
+        Open the peaks file for appending.  When resuming, rows written after
+        the last checkpoint are dropped since those frames will be redone.
+        """
+        if not resume or not exists(self.peaks_path):
+            fp = open(self.peaks_path, 'w')
+            fp.write('frame,peak,row,col\n')
+            return fp
+
+        with open(self.peaks_path) as fp:
+            lines = fp.readlines()
+
+        keep = [lines[0]] + [line for line in lines[1:]
+                             if int(line.split(',', 1)[0]) < self.start]
+        fp = open(self.peaks_path, 'w')
+        fp.writelines(keep)
+        return fp
+
+    def checkpoint(self, frames: int, peaks_file, store):
+        """
+        Flush everything written so far and record that the first `frames`
+        frames are complete.
+        """
+        peaks_file.flush()
+        if store is not None:
+            store.flush()
+
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w') as fp:
+            json.dump({'video': abspath(self.video), 'frames': frames}, fp)
+        replace(temporary, self.checkpoint_path)
+
+
+class Progress:
+    """
+    :class Progress:
+
+    Single line progress display on stderr.
+    """
+    INTERVAL = 0.5
+
+    def __init__(self, name: str, start: int, total: int):
+        self.name = name
+        self.start = start
+        self.total = max(total, 1)
+        self.began = time.monotonic()
+        self.last = 0.
+
+    def update(self, frames: int, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last < self.INTERVAL:
+            return
+        self.last = now
+
+        elapsed = max(now - self.began, 1e-6)
+        rate = (frames - self.start) / elapsed
+        eta = (self.total - frames) / rate if rate > 0 else float('inf')
+        sys.stderr.write(
+                '\r{}: {}/{} ({:5.1f}%) {:7.1f} fps  ETA {:6.0f}s'.format(
+                    self.name, frames, self.total,
+                    100. * frames / self.total, rate, eta))
+        sys.stderr.flush()
+
+    def finish(self, frames: int):
+        self.update(frames, force=True)
+        sys.stderr.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+"""
+Pipelined client over `zmq.asyncio`.
+
+`Client` talks over a REQ socket, which allows a single request in flight; the
+server sits idle while a reply travels back and the next request is packaged.
+`AsyncClient` instead sends over a DEALER socket, and tags every request with
+a correlation ID frame ahead of the envelope delimiter.  The server (and the
+broker) echo the envelope back unchanged, so replies, which may arrive in any
+order, are matched to their requests by that ID.
+"""
+import asyncio
+import itertools
+import uuid
+from collections import deque
+import numpy as np
+import zmq
+import zmq.asyncio
+from flysight.client.client import Client
+from flysight.codec import encode_image
+from flysight.message_pb2 import (
+        Request,
+        RepDetections,
+        RepDetectionsBatch,
+        RepTracking,
+        RepSession,
+        RepStatistics,
+        )
+
+
+class AsyncClient(Client):
+    """
+    :class AsyncClient:
+
+    Coroutine counterpart of `Client`, with the same options.  Up to `window`
+    requests are in flight at once; further requests wait for a slot.  A
+    single task receives the replies and completes the future of each
+    request.
+
+    Pixel data is never passed through shared memory, as the slots of a ring
+    would be reused by the requests in flight.
+    """
+    def __init__(self, uri: str, window: int = 8):
+        self.window = window
+        self.actx = None
+
+        # {
+        # correlation ID -> future of the reply, for the requests in flight.
+        self.pending = {}
+        self.correlations = itertools.count()
+        self.slots = None
+        self.receiver = None
+        # }
+
+        # The error which stopped the receiver, failing every later request
+        # until `reset`.
+        self.failure = None
+
+        super().__init__(uri)
+
+    def use_shared_memory(self, slots: int, max_pixels: int):
+        raise ValueError('Shared memory is not supported by AsyncClient')
+
+    def reset(self):
+        """
+        (Re)connect the DEALER socket.  Requests in flight are failed with
+        `ConnectionResetError`.
+        """
+        if self.socket is not None:
+            self.abort()
+            self.socket.close(linger=0)
+        self.failure = None
+
+        # The asyncio context shadows the synchronous one; both refer to the
+        # same underlying ZMQ context.
+        if self.actx is None:
+            self.actx = zmq.asyncio.Context.shadow(self.ctx.underlying)
+
+        self.socket = self.actx.socket(zmq.DEALER)
+        self.socket.connect(self.uri)
+
+    def abort(self):
+        """
+        Stop receiving, and fail the requests in flight.
+        """
+        if self.receiver is not None:
+            self.receiver.cancel()
+            self.receiver = None
+
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionResetError(
+                        'Connection to {} reset'.format(self.uri)))
+        self.pending.clear()
+
+    async def request(self, req: Request, frames: list = None) -> list:
+        """
+        Send `req`, followed by any pixel `frames`, and wait for its reply
+        within `timeout_ms`.  Returns the frames of the reply (as `zmq.Frame`).
+
+        A request which times out is abandoned, its reply is dropped should it
+        arrive later, and unlike with `Client` the socket is kept.
+        """
+        if self.failure is not None:
+            raise ConnectionError('Receiving from {} failed: {}'.format(
+                                    self.uri, self.failure)) from self.failure
+
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.window)
+
+        async with self.slots:
+            correlation = next(self.correlations)
+            future = asyncio.get_running_loop().create_future()
+            self.pending[correlation] = future
+
+            timeout = None
+            if self.timeout_ms is not None:
+                timeout = self.timeout_ms / 1000.
+
+            try:
+                return await asyncio.wait_for(
+                        self.exchange(correlation, future, req, frames),
+                        timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError('No reply from {} within {} ms'.format(
+                                    self.uri, self.timeout_ms)) from None
+            finally:
+                self.pending.pop(correlation, None)
+
+    async def exchange(self, correlation: int, future: asyncio.Future,
+                       req: Request, frames: list) -> list:
+        # Sending waits while the server is unreachable, so it counts towards
+        # the timeout too.
+        await self.socket.send_multipart(
+                [correlation.to_bytes(8, 'big'),
+                 b'',
+                 req.SerializeToString()] + (frames or []),
+                copy=False)
+
+        if self.receiver is None or self.receiver.done():
+            self.receiver = asyncio.ensure_future(self.receive_loop())
+
+        return await future
+
+    async def receive_loop(self):
+        """
+        Complete the futures of the requests in flight with their replies,
+        until none are left.  Should receiving fail, every request in flight
+        fails with the error, and so does every later one until `reset`.
+        """
+        try:
+            while self.pending:
+                (correlation, _, rep, *frames) = \
+                        await self.socket.recv_multipart(copy=False)
+
+                future = self.pending.get(
+                        int.from_bytes(correlation.bytes, 'big'))
+                if future is None or future.done():
+                    continue
+
+                # Malformed requests are answered with an error string.
+                if rep.bytes.startswith(b'ERROR:'):
+                    future.set_exception(RuntimeError(rep.bytes.decode()))
+                else:
+                    future.set_result([rep] + frames)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            self.failure = err
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(err)
+            self.pending.clear()
+
+    def close(self):
+        """
+        Close the socket, failing any requests in flight.
+        """
+        self.abort()
+        self.socket.close(linger=0)
+
+    async def detect(self, image: np.array) -> (np.array, [(float, float)]):
+        """
+        The (heatmap, peaks) of `image`, as `Client.detect` returns them.
+        """
+        req = Request()
+        detect = req.detections
+        self.set_options(detect)
+
+        frames = [] if self.zero_copy else None
+        encode_image(image, detect.image, frames)
+        (rep, *frames) = await self.request(req, frames)
+
+        detections = RepDetections()
+        detections.ParseFromString(rep.bytes)
+        return self.unpack(detections, frames, image.shape)
+
+    async def detect_batch(self, images: [np.array]
+                          ) -> [(np.array, [(float, float)])]:
+        """
+        The (heatmap, peaks) of every image, sent as a single
+        `ReqDetectionsBatch`.
+        """
+        req = Request()
+        batch = req.detections_batch
+        self.set_options(batch)
+
+        frames = [] if self.zero_copy else None
+        for image in images:
+            encode_image(image, batch.images.add(), frames)
+        (rep, *frames) = await self.request(req, frames)
+
+        detections = RepDetectionsBatch()
+        detections.ParseFromString(rep.bytes)
+        return [self.unpack(detection, frames, image.shape)
+                for (detection, image) in zip(detections.detections, images)]
+
+    def submit(self, image: np.array) -> asyncio.Future:
+        """
+        Start detecting `image`; the future of its (heatmap, peaks).
+        """
+        return asyncio.ensure_future(self.detect(image))
+
+    async def detect_many(self, images, batch_size: int = 1):
+        """
+        Detect every image of the iterable `images`, yielding the results in
+        order.  Images are sent `batch_size` to a request, and up to `window`
+        requests are kept in flight.
+        """
+        images = iter(images)
+        queue = deque()
+
+        try:
+            while True:
+                while len(queue) < self.window:
+                    batch = list(itertools.islice(images, batch_size))
+                    if not batch:
+                        break
+                    queue.append(asyncio.ensure_future(
+                            self.detect_batch(batch) if batch_size > 1
+                            else self.detect(batch[0])))
+
+                if not queue:
+                    return
+
+                result = await queue.popleft()
+                if batch_size > 1:
+                    for detection in result:
+                        yield detection
+                else:
+                    yield result
+        finally:
+            for future in queue:
+                future.cancel()
+            await asyncio.gather(*queue, return_exceptions=True)
+
+    async def track(self, peaks: [(float, float)], context: bytes = None
+                   ) -> ([(int, float, float)], bytes):
+        """
+        The confirmed tracks of a frame and the new context, as
+        `Client.track` returns them.
+        """
+        req = Request()
+        tracking = req.tracking
+        if self.session is not None:
+            tracking.session = self.session
+        elif context is not None:
+            tracking.context = context
+
+        for (row, col) in peaks:
+            peak = tracking.peaks.add()
+            peak.row = row
+            peak.col = col
+
+        (rep, *_) = await self.request(req)
+
+        tracking = RepTracking()
+        tracking.ParseFromString(rep.bytes)
+
+        tracks = []
+        for track in tracking.tracks:
+            tracks.append((track.track_id,
+                           track.coordinate.row,
+                           track.coordinate.col))
+
+        if not tracking.HasField('context'):
+            return (tracks, None)
+
+        return (tracks, tracking.context)
+
+    async def open_session(self, context: bytes = None) -> str:
+        """
+        Track in a new server side session, see `Client.open_session`.
+        """
+        self.session = uuid.uuid4().hex
+        if context is not None:
+            await self.restore(context)
+
+        return self.session
+
+    async def close_session(self):
+        if self.session is not None:
+            await self.request_session(close=True)
+            self.session = None
+
+    async def snapshot(self) -> bytes:
+        rep = await self.request_session(snapshot=True)
+        return rep.context if rep.HasField('context') else None
+
+    async def restore(self, context: bytes):
+        await self.request_session(restore=context)
+
+    async def request_session(self, restore: bytes = None,
+                              snapshot: bool = False,
+                              close: bool = False) -> RepSession:
+        req = Request()
+        req.session.session = self.session
+        if restore is not None:
+            req.session.restore = restore
+        req.session.snapshot = snapshot
+        req.session.close = close
+
+        (rep, *_) = await self.request(req)
+
+        session = RepSession()
+        session.ParseFromString(rep.bytes)
+        return session
+
+    async def statistics(self, stream: bool = True) -> (int, int):
+        req = Request()
+        req.statistics.SetInParent()
+        if stream:
+            req.statistics.stream = self.stream
+
+        (rep, *_) = await self.request(req)
+
+        statistics = RepStatistics()
+        statistics.ParseFromString(rep.bytes)
+        return (statistics.skipped, statistics.computed)
@@ -1,9 +1,18 @@
+import itertools
+import uuid
+import cv2
 import numpy as np
 import zmq
+from flysight.codec import decode_heatmap, encode_image
+from flysight.shared_ring import SharedRing
 from flysight.message_pb2 import (
+        FLOAT32,
         Request,
         RepDetections,
+        RepDetectionsBatch,
         RepTracking,
+        RepSession,
+        RepStatistics,
         )
 
 class Client:
@@ -14,15 +23,163 @@ class Client:
     packaging logic.
     """
     def __init__(self, uri: str):
-        ctx = zmq.Context()
-        self.socket = ctx.socket(zmq.REQ)
-        self.socket.connect(uri)
+        self.uri = uri
+        self.ctx = zmq.Context()
+        self.socket = None
+        self.reset()
+
+        # Longest wait for a reply in milliseconds, None waits forever.  On a
+        # timeout `TimeoutError` is raised and the socket is reset.
+        self.timeout_ms = None
 
         # {
         self.return_heatmap = True
         self.return_peaks = True
         # }
 
+        # {
+        # `upsample_heatmap` requests a heatmap with the dimensions of the
+        # image.  With `native_heatmap` the native 512x512 heatmap is fetched
+        # and upsampled here instead of on the server, which is far less data
+        # to transfer.  `heatmap_encoding` is one of the protobuf `Encoding`.
+        self.upsample_heatmap = True
+        self.native_heatmap = False
+        self.heatmap_encoding = FLOAT32
+        # }
+
+        # With `zero_copy` the image and heatmap are not embedded in the
+        # protobuf message; they are sent as separate ZMQ frames, without
+        # copying, and wrapped on receipt.
+        self.zero_copy = False
+
+        # When set, see `use_shared_memory`, images and heatmaps are passed
+        # through a `SharedRing` and only slot indices are sent.
+        self.shared_ring = None
+
+        # When set, see `open_session`, the tracker is kept by the server and
+        # `track` sends only the peaks.
+        self.session = None
+
+        # {
+        # Evaluate only the `regions` of the image, as (row, col, rows, cols)
+        # pixel rectangles, all of it if empty.  With `motion`, only the parts
+        # of them which moved since the previous images of `stream`.  The
+        # server may also skip an image which barely changed since the last
+        # one of `stream` it evaluated (see `statistics`).
+        self.regions = []
+        self.motion = False
+        self.stream = uuid.uuid4().hex
+        # }
+
+    def use_shared_memory(self, slots: int, max_pixels: int):
+        """
+        Pass pixel data through shared memory.  Only valid if the server runs
+        on this host.  Images larger than `max_pixels` fall back to frames.
+        """
+        # A heatmap slot can hold an upsampled float32 heatmap.
+        self.shared_ring = SharedRing.Create(
+                slots, max_pixels, max_pixels * np.dtype(np.float32).itemsize)
+
+    def reset(self):
+        """
+        (Re)connect the socket.  A REQ socket which never received its reply
+        cannot send again, so it is replaced, dropping the pending request.
+        """
+        if self.socket is not None:
+            self.socket.close(linger=0)
+
+        self.socket = self.ctx.socket(zmq.REQ)
+        self.socket.connect(self.uri)
+
+    def receive(self, copy: bool = True) -> list:
+        """
+        Receive the multipart reply to the request just sent, within
+        `timeout_ms`.  An error reply from the server raises RuntimeError.
+        """
+        if self.timeout_ms is not None \
+                and not self.socket.poll(self.timeout_ms, zmq.POLLIN):
+            self.reset()
+            raise TimeoutError('No reply from {} within {} ms'.format(
+                                self.uri, self.timeout_ms))
+
+        reply = self.socket.recv_multipart(copy=copy)
+        head = memoryview(reply[0] if copy else reply[0].buffer)
+        if head[:6] == b'ERROR:':
+            raise RuntimeError(bytes(head).decode())
+
+        return reply
+
+    def open_session(self, context: bytes = None) -> str:
+        """
+        Track in a new server side session, optionally restored from a
+        `snapshot`.  Returns the session ID.
+        """
+        self.session = uuid.uuid4().hex
+        if context is not None:
+            self.restore(context)
+
+        return self.session
+
+    def close_session(self):
+        if self.session is not None:
+            self.request_session(close=True)
+            self.session = None
+
+    def snapshot(self) -> bytes:
+        """
+        The tracker context of the session, for `restore` or `open_session`.
+        None if the server holds no tracker for the session.
+        """
+        rep = self.request_session(snapshot=True)
+        return rep.context if rep.HasField('context') else None
+
+    def restore(self, context: bytes):
+        """
+        Replace the tracker of the session with `context`.
+        """
+        self.request_session(restore=context)
+
+    def request_session(self, restore: bytes = None, snapshot: bool = False,
+                        close: bool = False) -> RepSession:
+        req = Request()
+        req.session.session = self.session
+        if restore is not None:
+            req.session.restore = restore
+        req.session.snapshot = snapshot
+        req.session.close = close
+
+        self.socket.send(req.SerializeToString())
+
+        rep = RepSession()
+        rep.ParseFromString(self.receive()[0])
+        return rep
+
+    def statistics(self, stream: bool = True) -> (int, int):
+        """
+        The (skipped, computed) frame counts of the server's change gating,
+        for the `stream` of this client or for every stream.
+        """
+        req = Request()
+        req.statistics.SetInParent()
+        if stream:
+            req.statistics.stream = self.stream
+
+        self.socket.send(req.SerializeToString())
+
+        rep = RepStatistics()
+        rep.ParseFromString(self.receive()[0])
+        return (rep.skipped, rep.computed)
+
+    def close(self):
+        """
+        Close the socket and release any shared memory.
+        """
+        if self.shared_ring is not None:
+            self.shared_ring.close()
+            self.shared_ring = None
+
+        self.socket.close()
+
     def detect(self, image: np.array) -> (np.array, [(float, float)]):
         """
         This is the network interface for handling detections.  It does;
@@ -36,34 +193,185 @@ class Client:
         # Package the request.
         req = Request()
         detect = req.detections
-        detect.return_heatmap = self.return_heatmap
-        detect.return_peaks = self.return_peaks
-        detect.upsample_heatmap = True
-        detect.image.data = image.tobytes()
-        detect.image.rows = image.shape[0]
-        detect.image.cols = image.shape[1]
-        self.socket.send(req.SerializeToString())
+        self.set_options(detect)
+
+        shared = None
+        frames = [] if self.zero_copy else None
+        if self.shared_ring is not None:
+            shared = self.shared_ring.acquire()
+            frames = []
+
+        encode_image(image, detect.image, frames, shared)
+        self.socket.send_multipart([req.SerializeToString()] + (frames or []),
+                                   copy=False)
         # }
 
         # Receive the results
-        rep = self.socket.recv()
+        (rep, *frames) = self.receive(copy=False)
 
-        # {
-        # Unpack the results.
         detections = RepDetections()
-        detections.ParseFromString(rep)
+        detections.ParseFromString(rep.bytes)
+        return self.unpack(detections, frames, image.shape)
+
+    def detect_many(self, images, batch_size: int = 8,
+                    depth: int = 4) -> [(np.array, [(float, float)])]:
+        """
+        Detect every image of the iterable `images`, yielding the results in
+        order, as `detect` returns them.
+
+        The images are sent `batch_size` at a time, each batch as a single
+        `ReqDetectionsBatch`, over a DEALER socket of their own.  Up to `depth`
+        batches are in flight (or held until the batches before them are
+        answered), so the server is never idle waiting for the next request.
+        Replies are matched to their batch by a sequence number sent as an
+        extra envelope frame, which the server (and the broker) echo back.
+        Images are never passed through shared memory here.
+        """
+        images = iter(images)
+        socket = self.ctx.socket(zmq.DEALER)
+        socket.connect(self.uri)
+
+        try:
+            # sequence -> image shapes of the batches in flight, and the
+            # results of those answered out of order.
+            shapes = {}
+            completed = {}
+            (sent, done) = (0, 0)
+            exhausted = False
+
+            while True:
+                while not exhausted and sent - done < depth:
+                    batch = list(itertools.islice(images, batch_size))
+                    if not batch:
+                        exhausted = True
+                        break
+
+                    self.send_batch(socket, sent, batch)
+                    shapes[sent] = [image.shape for image in batch]
+                    sent += 1
+
+                if done == sent:
+                    return
+
+                while done not in completed:
+                    if self.timeout_ms is not None \
+                            and not socket.poll(self.timeout_ms, zmq.POLLIN):
+                        raise TimeoutError(
+                                'No reply from {} within {} ms'.format(
+                                    self.uri, self.timeout_ms))
+
+                    (sequence, _, rep, *frames) = \
+                            socket.recv_multipart(copy=False)
+                    sequence = int.from_bytes(sequence.bytes, 'big')
+
+                    if rep.bytes.startswith(b'ERROR:'):
+                        raise RuntimeError(rep.bytes.decode())
+
+                    detections = RepDetectionsBatch()
+                    detections.ParseFromString(rep.bytes)
+                    completed[sequence] = [
+                            self.unpack(detection, frames, shape)
+                            for (detection, shape) in zip(
+                                detections.detections, shapes.pop(sequence))]
+
+                yield from completed.pop(done)
+                done += 1
+        finally:
+            socket.close(linger=0)
+
+    def send_batch(self, socket: zmq.Socket, sequence: int,
+                   images: [np.array]):
+        req = Request()
+        batch = req.detections_batch
+        self.set_options(batch)
+
+        frames = [] if self.zero_copy else None
+        for image in images:
+            encode_image(image, batch.images.add(), frames)
 
+        socket.send_multipart([sequence.to_bytes(4, 'big'),
+                               b'',
+                               req.SerializeToString()] + (frames or []),
+                              copy=False)
+
+    def set_options(self, detect):
+        """
+        Set the options of a `ReqDetections` or `ReqDetectionsBatch`.
+        """
+        detect.return_heatmap = self.return_heatmap
+        detect.return_peaks = self.return_peaks
+        detect.upsample_heatmap = self.upsample_heatmap \
+                              and not self.native_heatmap
+        detect.heatmap_encoding = self.heatmap_encoding
+
+        for (row, col, rows, cols) in self.regions:
+            roi = detect.regions.add()
+            (roi.row, roi.col, roi.rows, roi.cols) = (row, col, rows, cols)
+        detect.stream = self.stream
+        detect.motion = self.motion
+
+    def unpack(self, detections: RepDetections, frames: list,
+               shape: (int, int)) -> (np.array, [(float, float)]):
+        """
+        The (heatmap, peaks) of the reply for an image of `shape`.
+        """
         if self.return_heatmap:
-            image = np.frombuffer(detections.heatmap.data, dtype=np.float32
-                    ).reshape(detections.heatmap.rows,
-                              detections.heatmap.cols)
+            heatmap = decode_heatmap(detections.heatmap, frames)
+
+            # The shared slot is reused by later requests.
+            if detections.heatmap.HasField('shared_memory') \
+                    and not heatmap.flags.owndata:
+                heatmap = heatmap.copy()
+
+            if self.upsample_heatmap and self.native_heatmap:
+                heatmap = cv2.resize(heatmap, (shape[1], shape[0]),
+                                     interpolation=cv2.INTER_LINEAR)
         else:
-            image = None
+            heatmap = None
 
         peaks = []
         for peak in detections.peaks:
             peaks.append((peak.row, peak.col))
-        # }
 
-        return (image, peaks)
+        return (heatmap, peaks)
+
+    def track(self, peaks: [(float, float)], context: bytes = None
+             ) -> ([(int, float, float)], bytes):
+        """
+        This is the network interface for tracking.  Associates the `peaks`
+        of a frame, as returned by `detect`, with the tracks held in
+        `context`; the context returned by the previous call, or None on the
+        first frame.  Returns the confirmed (track_id, row, col) tracks of the
+        frame and the new context.
+
+        In a session (see `open_session`) the server holds the tracks, no
+        context is passed and None is returned for it.
+        """
+        req = Request()
+        tracking = req.tracking
+        if self.session is not None:
+            tracking.session = self.session
+        elif context is not None:
+            tracking.context = context
+
+        for (row, col) in peaks:
+            peak = tracking.peaks.add()
+            peak.row = row
+            peak.col = col
+
+        self.socket.send(req.SerializeToString())
+        rep = self.receive()[0]
+
+        tracking = RepTracking()
+        tracking.ParseFromString(rep)
+
+        tracks = []
+        for track in tracking.tracks:
+            tracks.append((track.track_id,
+                           track.coordinate.row,
+                           track.coordinate.col))
+
+        if not tracking.HasField('context'):
+            return (tracks, None)
 
+        return (tracks, tracking.context)
@@ -0,0 +1,75 @@
+"""
+Coloring of heatmaps, as lookups into precomputed tables of ARGB32 pixels.
+
+A heatmap is normalized to uint8 once.  From there, coloring it, and blending
+it over the grayscale frame, is a single table lookup per pixel.  The blended
+table is indexed by the heatmap value and the gray level together, so no
+arithmetic is done per pixel.
+"""
+import cv2
+import numpy as np
+from flysight.client.colormap_data import COLORMAPS
+
+
+def normalize(heatmap: np.array) -> np.array:
+    """
+    The heatmap scaled from its [min, max] to [0, 255], as uint8.
+    """
+    if heatmap.dtype not in (np.float32, np.float64, np.uint8):
+        heatmap = heatmap.astype(np.float32)
+    return cv2.normalize(heatmap, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+
+
+def argb(rgb: np.array) -> np.array:
+    """
+    Opaque ARGB32 pixels from the RGB triples along the last axis.
+    """
+    rgb = rgb.astype(np.uint32)
+    return 0xff000000 | rgb[..., 0] << 16 | rgb[..., 1] << 8 | rgb[..., 2]
+
+
+class Colormap:
+    """
+    :class Colormap:
+
+    The tables of a colormap of 256 colors:
+
+    - `opaque` maps a heatmap value to its color.
+    - `overlay` maps a heatmap value and a gray level, as `value << 8 | gray`,
+      to the color blended over the gray level with an opacity of
+      value / 255.
+    - `gray` maps a gray level to its pixel.
+    """
+    @staticmethod
+    def Named(name: str):
+        """
+        One of the embedded colormaps (see `COLORMAPS`).
+        """
+        if name not in COLORMAPS:
+            raise ValueError('Unknown colormap: {}'.format(name))
+
+        rgb = np.frombuffer(bytes.fromhex(COLORMAPS[name]), dtype=np.uint8)
+        return Colormap(rgb.reshape(256, 3))
+
+    def __init__(self, rgb: np.array):
+        self.opaque = argb(rgb)
+
+        levels = np.arange(256, dtype=np.float32)
+        alpha = (levels / 255.)[:, None, None]
+        blended = rgb[:, None, :] * alpha \
+                + levels[None, :, None] * (1. - alpha)
+        self.overlay = argb(np.rint(blended)).ravel()
+
+        self.gray = argb(np.repeat(levels[:, None], 3, axis=1))
+
+    def colorize(self, heatmap: np.array, image: np.array = None) -> np.array:
+        """
+        The ARGB32 pixels of a normalized heatmap (see `normalize`), blended
+        over the grayscale `image` of the same shape if there is one.
+        """
+        if image is None:
+            return self.opaque[heatmap]
+
+        index = heatmap.astype(np.uint16) << 8
+        index |= image
+        return self.overlay[index]
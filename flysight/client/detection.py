@@ -0,0 +1,88 @@
+import threading
+import numpy as np
+from PySide2 import QtCore
+from flysight.client.client import Client
+
+
+class DetectionWorker(QtCore.QThread):
+    """
+    :class DetectionWorker:
+
+    Runs `Client.detect` off the GUI thread.  Requests are latest-wins; a
+    request replaces any which has not started yet, and the result of a
+    request which was superseded while in flight is dropped.  Results are
+    delivered through the `detected` and `failed` signals, which are queued
+    onto the GUI thread.
+    """
+    # (frame_idx, image, heatmap, peaks)
+    detected = QtCore.Signal(int, object, object, object)
+
+    # (frame_idx, message)
+    failed = QtCore.Signal(int, str)
+
+    def __init__(self, client: Client, parent=None):
+        super().__init__(parent)
+        self.client = client
+
+        # {
+        # The latest request, and its sequence number, guarded by `condition`.
+        self.pending = None
+        self.sequence = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+        # }
+
+    def request(self, frame_idx: int, image: np.array):
+        """
+        Detect `image`, superseding every earlier request.
+        """
+        with self.condition:
+            self.sequence += 1
+            self.pending = (self.sequence, frame_idx, image)
+            self.condition.notify()
+
+    def cancel(self):
+        """
+        Supersede every earlier request without making a new one.
+        """
+        with self.condition:
+            self.sequence += 1
+            self.pending = None
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        self.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopped:
+                    self.condition.wait()
+
+                if self.stopped:
+                    break
+
+                (sequence, frame_idx, image) = self.pending
+                self.pending = None
+
+            try:
+                (heatmap, peaks) = self.client.detect(image)
+            except TimeoutError as err:
+                self.failed.emit(frame_idx, str(err))
+                continue
+            except Exception as err:
+                # A malformed or error reply; the socket may be left waiting
+                # for a reply, so it is reconnected.
+                self.client.reset()
+                self.failed.emit(frame_idx, '{}: {}'.format(
+                                    type(err).__name__, err))
+                continue
+
+            with self.condition:
+                if sequence != self.sequence:
+                    continue
+
+            self.detected.emit(frame_idx, image, heatmap, peaks)
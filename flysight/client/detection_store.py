@@ -0,0 +1,186 @@
+"""
+Persistent cache of the detections of every frame of a video, so that a video
+which has been visited before needs no inference.
+
+A store is a directory named by a hash of the video content, the model and
+every parameter which affects the detections, holding memory mapped arrays:
+
+    heatmaps.npy    [frames, rows, cols] uint8, quantized (see `quantize`)
+    scales.npy      [frames, 2] float32, the scale and offset of each heatmap
+    peaks.npy       [frames, max_peaks, 2] float32
+    counts.npy      [frames] int32, the number of peaks, -1 if not cached
+
+The count of a frame is written last, so a frame is never read half written.
+"""
+import hashlib
+import json
+import threading
+from os import makedirs
+from os.path import exists, getsize, join
+import numpy as np
+from flysight.client.client import Client
+from flysight.codec import quantize
+from flysight.config import Config
+
+# Bytes hashed at either end of the video.
+SAMPLE_BYTES = 4 << 20
+
+
+def video_hash(path: str) -> str:
+    """
+    Content hash of a video from its size and its first and last
+    `SAMPLE_BYTES`, which is enough to tell videos apart without reading
+    them whole.
+    """
+    size = getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, 'rb') as fp:
+        digest.update(fp.read(SAMPLE_BYTES))
+        if size > SAMPLE_BYTES:
+            fp.seek(max(size - SAMPLE_BYTES, SAMPLE_BYTES))
+            digest.update(fp.read())
+
+    return digest.hexdigest()
+
+
+def model_hash() -> str:
+    """
+    Hash of the model file the server loads, or of its URL when this host has
+    no copy.
+    """
+    path = join(Config.Instance.model.cache, 'model.h5')
+    if not exists(path):
+        return hashlib.sha1(Config.Instance.model.url.encode()).hexdigest()
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class DetectionStore:
+    """
+    :class DetectionStore:
+
+    The store of one video.  The arrays are created by the first `put`, once
+    the heatmap dimensions are known.
+    """
+    @staticmethod
+    def Open(video: str, frame_count: int, client: Client):
+        """
+        The store of `video` for the current model and configuration, and the
+        heatmap settings of `client`.
+        """
+        centroid_detector = Config.Instance.centroid_detector
+        parameters = {
+            'video': video_hash(video),
+            'model': model_hash(),
+            'backend': Config.Instance.model.backend,
+            'tiling': vars(Config.Instance.model.tiling),
+            'gating': vars(Config.Instance.server.gating),
+            'centroid_detector': vars(centroid_detector),
+            'client': {
+                'upsample_heatmap': client.upsample_heatmap,
+                'native_heatmap': client.native_heatmap,
+                'heatmap_encoding': client.heatmap_encoding,
+                'regions': [list(region) for region in client.regions],
+                'motion': client.motion,
+            },
+        }
+        key = hashlib.sha1(
+                json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+        disk_cache = Config.Instance.client.disk_cache
+        return DetectionStore(join(disk_cache.path, key),
+                              frame_count,
+                              disk_cache.max_peaks)
+
+    def __init__(self, path: str, frame_count: int, max_peaks: int):
+        self.path = path
+        self.frame_count = frame_count
+        self.max_peaks = max_peaks
+        self.lock = threading.Lock()
+
+        self.heatmaps = None
+        self.scales = None
+        self.peaks = None
+        self.counts = None
+        if exists(join(path, 'counts.npy')):
+            self.load()
+
+    def array(self, name: str) -> str:
+        return join(self.path, name + '.npy')
+
+    def load(self):
+        self.heatmaps = np.load(self.array('heatmaps'), mmap_mode='r+')
+        self.scales = np.load(self.array('scales'), mmap_mode='r+')
+        self.peaks = np.load(self.array('peaks'), mmap_mode='r+')
+        self.counts = np.load(self.array('counts'), mmap_mode='r+')
+
+    def create(self, rows: int, cols: int):
+        makedirs(self.path, exist_ok=True)
+
+        def create_array(name, dtype, shape):
+            return np.lib.format.open_memmap(
+                    self.array(name), mode='w+', dtype=dtype, shape=shape)
+
+        frames = self.frame_count
+        self.heatmaps = create_array('heatmaps', np.uint8, (frames, rows, cols))
+        self.scales = create_array('scales', np.float32, (frames, 2))
+        self.peaks = create_array('peaks', np.float32,
+                                  (frames, self.max_peaks, 2))
+
+        # Created last; its presence marks a complete store.
+        counts = create_array('counts', np.int32, (frames, ))
+        counts[:] = -1
+        counts.flush()
+        self.counts = counts
+
+    def get(self, frame_idx: int) -> (np.array, [(float, float)]):
+        """
+        The (heatmap, peaks) of a frame, as returned by `Client.detect`, or
+        None if the frame is not cached.
+        """
+        if self.counts is None or not 0 <= frame_idx < self.frame_count:
+            return None
+
+        count = int(self.counts[frame_idx])
+        if count < 0:
+            return None
+
+        (scale, offset) = self.scales[frame_idx]
+        heatmap = self.heatmaps[frame_idx] * scale + offset
+        peaks = [tuple(peak) for peak in self.peaks[frame_idx, :count].tolist()]
+        return (heatmap, peaks)
+
+    def put(self, frame_idx: int, heatmap: np.array,
+            peaks: [(float, float)]):
+        """
+        Cache the detections of a frame.  Frames without a heatmap, with more
+        than `max_peaks` peaks, or with a heatmap of other dimensions than the
+        store are not cached.
+        """
+        if heatmap is None or len(peaks) > self.max_peaks \
+                or not 0 <= frame_idx < self.frame_count:
+            return
+
+        with self.lock:
+            if self.counts is None:
+                self.create(*heatmap.shape[:2])
+
+        if self.heatmaps.shape[1:] != heatmap.shape[:2]:
+            return
+
+        (data, scale, offset) = quantize(heatmap)
+        self.heatmaps[frame_idx] = data
+        self.scales[frame_idx] = (scale, offset)
+        if peaks:
+            self.peaks[frame_idx, :len(peaks)] = peaks
+        self.counts[frame_idx] = len(peaks)
+
+    def flush(self):
+        if self.counts is not None:
+            for array in (self.heatmaps, self.scales, self.peaks, self.counts):
+                array.flush()
@@ -1,22 +1,48 @@
 import numpy as np
-from matplotlib import cm
-from flysight.client.display_zoom import DisplayZoom
+from flysight.client.colormap import Colormap, normalize
+from flysight.client.display_zoom import DisplayZoom, sample
+from flysight.client.pyramid import Pyramid
+from flysight.config import Config
 from PySide2 import (
         QtWidgets,
         QtCore,
         QtGui,
         )
 
+
+def same_key(lhs: tuple, rhs: tuple) -> bool:
+    """
+    Whether two cache keys match.  Their arrays (and lists) are replaced,
+    never modified, so they are compared by identity.  Keys hold references
+    to them, as the `id` of a collected array may be reused by a new one.
+    """
+    if rhs is None or len(lhs) != len(rhs):
+        return False
+
+    return all(a is b if isinstance(a, (np.ndarray, list)) else a == b
+               for (a, b) in zip(lhs, rhs))
+
+
 class DisplayMain(QtWidgets.QWidget):
     """
     :class DisplayMain:
 
     This class implements the main display region for heatmaps/image/peaks.
+
+    The view zooms with the mouse wheel, pans by dragging, and fits the frame
+    again on a double click.  Only the tiles of the frame pyramid (see
+    `Pyramid`) which are in view are drawn, at the level matching the zoom,
+    each with the heatmap blended in (see `Colormap`).
     """
-    def __init__(self, parent, client, width: int, height: int):
+    # Largest zoom, in display pixels per frame pixel.
+    MAX_SCALE = 32.
+
+    # Zoom per wheel step.
+    ZOOM_STEP = 1.25
+
+    def __init__(self, parent, width: int, height: int):
         super().__init__(parent)
         self.p = parent
-        self.client = client
         self.resize(width, height)
         self.setup_ui()
 
@@ -37,6 +63,39 @@ class DisplayMain(QtWidgets.QWidget):
         self.peaks = []
         # }
 
+        # {
+        # The heatmap normalized to uint8 (see `heatmap8`), and the heatmap it
+        # was normalized from.
+        self.normalized = None
+        self.normalized_from = None
+        # }
+
+        # {
+        # The view; the zoom relative to fitting the frame in the widget, and
+        # the frame coordinates (x, y) of the top left corner of the widget.
+        self.view_zoom = 1.
+        self.view_origin = (0., 0.)
+        self.drag = None
+        # }
+
+        # {
+        # The pyramid of the frame, rebuilt when it changes, and its tiles as
+        # drawn (see `__tile_pixels`), with the key they were drawn for.
+        self.image_pyramid = None
+        self.tiles = {}
+        self.tiles_key = None
+        # }
+
+        # Lines of text drawn over the display, e.g. playback statistics.
+        self.osd = []
+
+        # {
+        # The image, heatmap and peaks composited into a pixmap, and the key
+        # (see `render_key`) it was composited for.
+        self.rendered = None
+        self.rendered_key = None
+        # }
+
     def setup_ui(self):
         # {
         # Configure the main window defaults.  It enables mouse tracking to
@@ -55,30 +114,8 @@ class DisplayMain(QtWidgets.QWidget):
         self.setPalette(pal)
         # }
 
-        # {
-        # Pre-compute RGBA values for the two different modes from the `inferno`
-        # colormap.
-        #
-        # self.rgbas_alpha is used when the heatmap is overlayed atop the image.
-        # self.rgbas_noalpha is used when no image is displayed.
-        indices = np.linspace(0, 1, 256)
-        rgbas = cm.inferno(indices)
-
-        self.rgbas_noalpha = [
-                QtGui.QColor(
-                    int(r * 255),
-                    int(g * 255),
-                    int(b * 255),
-                    int(a * 255)).rgba() for r, g, b, a in rgbas]
-
-        rgbas[:,3] *= indices
-        self.rgbas_alpha = [
-                QtGui.QColor(
-                    int(r * 255),
-                    int(g * 255),
-                    int(b * 255),
-                    int(a * 255)).rgba() for r, g, b, a in rgbas]
-        # }
+        # The colormap of the heatmap.
+        self.colormap = Colormap.Named(Config.Instance.client.colormap)
 
     def set_show_image(self, toggle: bool):
         """
@@ -103,127 +140,347 @@ class DisplayMain(QtWidgets.QWidget):
 
     def load_image(self, frame_idx: int, image: np.array):
         """
-        Given an RGB image:
-        - Convert it to grayscale (assuming uniform channel)
-        - Use the ZMQ client to fetch a heatmap/peak solution
-        - Refresh the UI
+        Display a grayscale image, without detections until `set_frame`
+        provides them.
         """
-        self.image = image[:, :, 0]
-        #self.image = np.transpose(self.image).copy()
-        self.image = self.image.copy()
-        (self.heatmap, self.peaks) = self.client.detect(self.image)
+        self.set_frame(frame_idx, image, None, [])
+
+    def set_frame(self, frame_idx: int, image: np.array, heatmap: np.array,
+                  peaks: list):
+        """
+        Display a grayscale image with its (already fetched) detections.
+        """
+        if self.image is None or self.image.shape != image.shape:
+            self.view_zoom = 1.
+            self.view_origin = (0., 0.)
+
+        self.image = image
+        self.heatmap = heatmap
+        self.peaks = peaks
         self.frame_idx = frame_idx
         self.update()
 
+    def mousePressEvent(self, e):
+        """
+        Start panning.
+        """
+        if e.button() == QtCore.Qt.LeftButton:
+            self.drag = (e.pos(), self.view_origin)
+
+    def mouseReleaseEvent(self, e):
+        if e.button() == QtCore.Qt.LeftButton:
+            self.drag = None
+
+    def mouseDoubleClickEvent(self, e):
+        """
+        Fit the frame in the widget again.
+        """
+        if self.image is not None:
+            self.set_view(1., (0., 0.))
+
     def mouseMoveEvent(self, e):
         """
-        Handle the mouse move to update the zoom region.
+        Handle the mouse move to pan while dragging, and to update the zoom
+        region.
+        """
+        if self.drag is not None and self.image is not None:
+            (pos, (x, y)) = self.drag
+            scale = self.view_scale()
+            self.set_view(self.view_zoom,
+                          (x - (e.pos().x() - pos.x()) / scale,
+                           y - (e.pos().y() - pos.y()) / scale))
+
+        self.update_zoom(e.pos())
+
+    def wheelEvent(self, e):
+        """
+        Zoom about the frame pixel under the mouse.
         """
-        self.update_zoom(e)
+        if self.image is None:
+            return
+
+        steps = e.angleDelta().y() / 120.
+        (x, y) = self.to_frame(e.pos().x(), e.pos().y())
+
+        zoom = self.view_zoom * self.ZOOM_STEP ** steps
+        scale = self.fit_scale() * zoom
+        self.set_view(zoom, (x - e.pos().x() / scale, y - e.pos().y() / scale))
+        self.update_zoom(e.pos())
 
-    def update_zoom(self, pos):
+    def resizeEvent(self, e):
+        if self.image is not None:
+            self.set_view(self.view_zoom, self.view_origin)
+
+    def update_zoom(self, pos: QtCore.QPoint):
         """
-        Update the zoom box if it's possible.
+        Update the zoom box with the region of the frame under `pos`.
+
+        The region is sampled from the frame and heatmap arrays themselves,
+        not from what is drawn here, so the zoom shows frame pixels whatever
+        the size of the widget.  Each frame pixel becomes a block of
+        `DisplayZoom.MAGNIFICATION` squared zoom pixels (nearest neighbour).
         """
-        # Compute the bounding region.  If the computed box would fall outside
-        # of the display widget, don't bother to update the zoom region.
-        x_min = pos.x() - DisplayZoom.ZOOM_DIM
-        y_min = pos.y() - DisplayZoom.ZOOM_DIM
-        x_max = pos.x() + DisplayZoom.ZOOM_DIM
-        y_max = pos.y() + DisplayZoom.ZOOM_DIM
+        if self.image is None:
+            return
 
-        if not self.rect().contains(QtCore.QPoint(y_min, x_min)) or \
-           not self.rect().contains(QtCore.QPoint(y_max, x_max)):
+        # {
+        # Map the pointer through the view transform into the frame, and
+        # index the frame pixel under every zoom pixel.
+        (rows, cols) = self.image.shape[:2]
+        (x, y) = self.to_frame(pos.x(), pos.y())
+        if not (0 <= x < cols and 0 <= y < rows):
             return
 
-        # Update the actual zoom region.
-        screen = QtWidgets.QApplication.primaryScreen()
-        region = screen.grabWindow(
-                        self.winId(),
-                        pos.x() - DisplayZoom.ZOOM_DIM // 2,
-                        pos.y() - DisplayZoom.ZOOM_DIM // 2,
-                        DisplayZoom.ZOOM_DIM,
-                        DisplayZoom.ZOOM_DIM)
-        region = region.scaled(128, 128)
-        self.p.update_zoom(region)
+        row = int(y)
+        col = int(x)
+
+        offsets = np.arange(DisplayZoom.ZOOM_DIM * DisplayZoom.MAGNIFICATION) \
+                // DisplayZoom.MAGNIFICATION - DisplayZoom.ZOOM_DIM // 2
+        row_index = row + offsets
+        col_index = col + offsets
+        # }
+
+        image = None
+        if self.show_image:
+            image = sample(self.image, row_index, col_index)
+
+        pixels = None
+        if self.show_heatmap and self.heatmap is not None:
+            # The heatmap may be at a lower resolution than the frame.
+            (heat_rows, heat_cols) = self.heatmap.shape[:2]
+            heatmap = sample(self.heatmap8(),
+                             row_index * heat_rows // rows,
+                             col_index * heat_cols // cols)
+            pixels = self.colormap.colorize(heatmap, image)
+        elif image is not None:
+            pixels = self.colormap.gray[image]
+
+        peaks = []
+        if self.show_peaks:
+            # Zoom coordinates of the peaks, relative to the top left frame
+            # pixel of the region.
+            for (r, c) in self.peaks:
+                x = (r * cols - col_index[0]) * DisplayZoom.MAGNIFICATION
+                y = (c * rows - row_index[0]) * DisplayZoom.MAGNIFICATION
+                peaks.append((x, y))
+
+        self.p.update_zoom(DisplayZoom.composite(pixels, peaks))
+
+    def heatmap8(self) -> np.array:
+        """
+        The heatmap normalized to [0, 255], shared by the display and the zoom.
+        """
+        if self.normalized_from is not self.heatmap:
+            self.normalized = normalize(self.heatmap)
+            self.normalized_from = self.heatmap
+
+        return self.normalized
+
+    def fit_scale(self) -> float:
+        """
+        The scale at which the whole frame fits in the widget, keeping its
+        aspect ratio.
+        """
+        (rows, cols) = self.image.shape[:2]
+        return min(self.width() / cols, self.height() / rows)
+
+    def view_scale(self) -> float:
+        """
+        Display pixels per frame pixel.
+        """
+        return self.fit_scale() * self.view_zoom
+
+    def set_view(self, zoom: float, origin: (float, float)):
+        """
+        Zoom and pan, keeping the frame in view.
+        """
+        fit = self.fit_scale()
+        zoom = min(max(zoom, 1.), max(self.MAX_SCALE / fit, 1.))
+        scale = fit * zoom
+
+        (rows, cols) = self.image.shape[:2]
+        x = min(max(origin[0], 0.), max(cols - self.width() / scale, 0.))
+        y = min(max(origin[1], 0.), max(rows - self.height() / scale, 0.))
+
+        if (zoom, (x, y)) != (self.view_zoom, self.view_origin):
+            self.view_zoom = zoom
+            self.view_origin = (x, y)
+            self.update()
+
+    def to_frame(self, x: float, y: float) -> (float, float):
+        """
+        The frame coordinates of a point of the widget.
+        """
+        scale = self.view_scale()
+        return (self.view_origin[0] + x / scale,
+                self.view_origin[1] + y / scale)
+
+    def to_widget(self, x: float, y: float) -> (float, float):
+        """
+        The widget coordinates of a point of the frame.
+        """
+        scale = self.view_scale()
+        return ((x - self.view_origin[0]) * scale,
+                (y - self.view_origin[1]) * scale)
+
+    def render_key(self) -> tuple:
+        """
+        Everything the composited pixmap depends on, see `same_key`.
+        """
+        return (self.frame_idx,
+                self.image,
+                self.heatmap,
+                self.peaks,
+                self.width(),
+                self.height(),
+                self.view_zoom,
+                self.view_origin,
+                self.show_image,
+                self.show_heatmap,
+                self.show_peaks)
 
     def paintEvent(self, e):
         """
         Overloaded paintEvent controlled by QWidget logic.
+
+        The image, heatmap and peaks are composited only when one of them, the
+        widget size, or a display toggle changed; any other repaint is a single
+        blit of the cached pixmap.
         """
+        key = self.render_key()
+        changed = not same_key(key, self.rendered_key)
+        if changed:
+            self.rendered = self.__render()
+            self.rendered_key = key
+
         painter = QtGui.QPainter()
         painter.begin(self)
+        painter.drawPixmap(0, 0, self.rendered)
 
-        if self.image is not None:
-            self.__draw_base(painter)
-
-        if self.heatmap is not None:
-            self.__draw_heatmap(painter)
-
-        if self.peaks is not None:
-            self.__draw_peaks(painter)
+        if self.osd:
+            self.__draw_osd(painter)
 
         self.last_frame_idx = self.frame_idx
         painter.end()
 
-        self.update_zoom(self.mapFromGlobal(QtGui.QCursor.pos()))
+        # The zoom shows what is drawn here, so it only needs refreshing when
+        # that changed.  Otherwise it follows the mouse.
+        if changed:
+            self.update_zoom(self.mapFromGlobal(QtGui.QCursor.pos()))
 
-    def __draw_base(self, painter):
+    def __render(self) -> QtGui.QPixmap:
         """
-        If the image is enabled, draw the image data to the display widget.
+        Composite the image, heatmap and peaks into a pixmap the size of the
+        widget.
         """
-        if not self.show_image:
-            return
+        pixmap = QtGui.QPixmap(self.size())
+        pixmap.fill(QtCore.Qt.black)
+
+        painter = QtGui.QPainter()
+        painter.begin(pixmap)
 
-        img = QtGui.QImage(self.image,
-                           self.image.shape[0],
-                           self.image.shape[1],
-                           QtGui.QImage.Format_Grayscale8)
-        self.qimage = img.scaled(self.size(), QtCore.Qt.KeepAspectRatio)
-        painter.drawImage(0, 0, self.qimage)
+        if self.image is not None:
+            self.__draw_frame(painter)
+
+        if self.peaks is not None:
+            self.__draw_peaks(painter)
+
+        painter.end()
+        return pixmap
 
-    def __draw_heatmap(self, painter):
+    def __draw_frame(self, painter):
         """
-        If the heatmap is enabled...
-        - Draw the translucent heatmap over the image (if the image is drawn)
-        - Draw the opaque heatmap (if the image is not drawn).
+        Draw the tiles of the frame which are in view, from the pyramid level
+        matching the view scale.  If the heatmap is enabled it is blended
+        into the tiles, translucent over the image if the image is enabled,
+        opaque otherwise.
         """
-        if not self.show_heatmap:
+        show_heatmap = self.show_heatmap and self.heatmap is not None
+        if not (self.show_image or show_heatmap):
             return
 
-        # Normalize [0, 1]
-        min = np.min(self.heatmap)
-        max = np.max(self.heatmap)
-        heatmap = (self.heatmap - min) / (max - min)
-
-        # Choose the RGBA colormap
-        heatmap8 = (heatmap * 255).astype(np.uint8)
-        if self.show_image:
-            rgbas = self.rgbas_alpha
-        else:
-            rgbas = self.rgbas_noalpha
-
-        # Create the image and draw it.
-        image = QtGui.QImage(heatmap8.data,
-                             heatmap8.shape[0],
-                             heatmap8.shape[1],
-                             QtGui.QImage.Format_Indexed8)
-        self.qheat_map = image.scaled(self.size(), QtCore.Qt.KeepAspectRatio)
-        self.qheat_map.setColorTable(rgbas)
-        painter.drawImage(0, 0, self.qheat_map)
+        if self.image_pyramid is None \
+                or self.image_pyramid.levels[0] is not self.image:
+            self.image_pyramid = Pyramid(self.image)
+
+        key = (self.image,
+               self.heatmap if show_heatmap else None,
+               self.show_image)
+        if not same_key(key, self.tiles_key):
+            self.tiles = {}
+            self.tiles_key = key
+
+        scale = self.view_scale()
+        k = self.image_pyramid.select(scale)
+        factor = 2 ** k
+
+        (left, top) = self.to_frame(0, 0)
+        (right, bottom) = self.to_frame(self.width(), self.height())
+
+        for (row, col, tile) in self.image_pyramid.visible(k, top, left,
+                                                           bottom, right):
+            pixels = self.tiles.get((k, row, col))
+            if pixels is None:
+                pixels = self.__tile_pixels(tile, row, col, factor,
+                                            show_heatmap)
+                self.tiles[(k, row, col)] = pixels
+
+            image = QtGui.QImage(pixels,
+                                 tile.shape[1],
+                                 tile.shape[0],
+                                 pixels.strides[0],
+                                 QtGui.QImage.Format_Grayscale8
+                                 if pixels.dtype == np.uint8
+                                 else QtGui.QImage.Format_ARGB32)
+
+            (x, y) = self.to_widget(col, row)
+            painter.drawImage(QtCore.QRectF(x,
+                                            y,
+                                            tile.shape[1] * factor * scale,
+                                            tile.shape[0] * factor * scale),
+                              image)
+
+    def __tile_pixels(self, tile: np.array, row: int, col: int, factor: int,
+                      show_heatmap: bool) -> np.array:
+        """
+        The pixels of a tile of the frame whose top left corner is at frame
+        pixel (`row`, `col`), and whose pixels each cover `factor` squared
+        frame pixels; the grayscale tile itself, or ARGB32 with the heatmap.
+        """
+        if not show_heatmap:
+            return tile
+
+        # The heatmap may be at a lower resolution than the frame (see
+        # `Client.native_heatmap`), it is stretched over the same region.
+        # Sample it at the center of every pixel of the tile.
+        heatmap8 = self.heatmap8()
+        (rows, cols) = self.image.shape[:2]
+        (heat_rows, heat_cols) = heatmap8.shape[:2]
+        row_index = (row + (np.arange(tile.shape[0]) + 0.5) * factor) \
+                  * heat_rows // rows
+        col_index = (col + (np.arange(tile.shape[1]) + 0.5) * factor) \
+                  * heat_cols // cols
+        heatmap = sample(heatmap8,
+                         row_index.astype(np.intp),
+                         col_index.astype(np.intp))
+
+        return self.colormap.colorize(heatmap,
+                                      tile if self.show_image else None)
 
     def __draw_peaks(self, painter):
         """
         If the peaks are enabled, draw the arrows on the display.
         """
-        if not self.show_peaks:
+        if not self.show_peaks or self.image is None:
             return
 
         painter.setPen(QtGui.QColor('#f67c25'))
-        mindim = min(self.size().height(), self.size().width())
+        (rows, cols) = self.image.shape[:2]
         for (r, c) in self.peaks:
-            row = mindim * r
-            col = mindim * c
+            (row, col) = self.to_widget(r * cols, c * rows)
+            if not (-20 <= row <= self.width() + 20
+                    and -20 <= col <= self.height() + 20):
+                continue
 
             # {
             # Draw an arrow.
@@ -237,3 +494,16 @@ class DisplayMain(QtWidgets.QWidget):
             painter.drawLine(center, rhs)
             # }
 
+    def __draw_osd(self, painter):
+        """
+        Draw the `osd` lines in the top left corner over a dark box.
+        """
+        metrics = painter.fontMetrics()
+        width = max(metrics.horizontalAdvance(line) for line in self.osd)
+        height = metrics.height()
+
+        painter.fillRect(0, 0, width + 8, height * len(self.osd) + 8,
+                         QtGui.QColor(0, 0, 0, 160))
+        painter.setPen(QtGui.QColor('#ffffff'))
+        for (index, line) in enumerate(self.osd):
+            painter.drawText(4, 4 + metrics.ascent() + index * height, line)
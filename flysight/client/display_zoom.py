@@ -6,21 +6,69 @@ from PySide2 import (
         )
 
 
+def sample(array: np.array, row_index: np.array,
+           col_index: np.array) -> np.array:
+    """
+    The pixels of `array` at the outer product of the row and column indices,
+    zero where an index falls outside of it.
+    """
+    (rows, cols) = array.shape[:2]
+    region = array[np.ix_(np.clip(row_index, 0, rows - 1),
+                          np.clip(col_index, 0, cols - 1))]
+    region[(row_index < 0) | (row_index >= rows)] = 0
+    region[:, (col_index < 0) | (col_index >= cols)] = 0
+    return region
+
+
 class DisplayZoom(QtWidgets.QWidget):
     """
     :class DisplayZoom:
 
-    This handles the 2x zoom box for the widget.
+    This handles the 2x zoom box for the widget.  It shows a region of
+    `ZOOM_DIM` squared frame pixels, each magnified to `MAGNIFICATION`
+    squared pixels.
     """
     ZOOM_DIM = 64
+    MAGNIFICATION = 2
+
+    @staticmethod
+    def composite(pixels: np.array,
+                  peaks: [(float, float)]) -> QtGui.QImage:
+        """
+        Composite the ARGB32 `pixels` of the region (see `Colormap`), which
+        may be None, with arrows at the `peaks` given in zoom coordinates.
+        """
+        size = DisplayZoom.ZOOM_DIM * DisplayZoom.MAGNIFICATION
+        zoom = QtGui.QImage(size, size, QtGui.QImage.Format_ARGB32)
+        zoom.fill(QtCore.Qt.black)
+
+        painter = QtGui.QPainter()
+        painter.begin(zoom)
+
+        if pixels is not None:
+            painter.drawImage(0, 0, QtGui.QImage(pixels,
+                                                 size,
+                                                 size,
+                                                 pixels.strides[0],
+                                                 QtGui.QImage.Format_ARGB32))
+
+        painter.setPen(QtGui.QColor('#f67c25'))
+        for (x, y) in peaks:
+            center = QtCore.QPointF(x, y)
+            painter.drawLine(center, QtCore.QPointF(x, y - 20))
+            painter.drawLine(center, QtCore.QPointF(x - 5, y - 7))
+            painter.drawLine(center, QtCore.QPointF(x + 5, y - 7))
+
+        painter.end()
+        return zoom
 
     def __init__(self, parent):
         super().__init__(parent)
         self.image = None
 
-    def update_image(self, image: np.array):
+    def update_image(self, image: QtGui.QImage):
         """
-        Set the zoom image data and redraw.
+        Set the zoom image (see `composite`) and redraw.
         """
         self.image = image
         self.update()
@@ -30,8 +78,8 @@ class DisplayZoom(QtWidgets.QWidget):
         This works in conjunction with the main widget to set a fixed size for
         this widget.
         """
-        return QtCore.QSize(DisplayZoom.ZOOM_DIM * 2,
-                            DisplayZoom.ZOOM_DIM * 2)
+        return QtCore.QSize(DisplayZoom.ZOOM_DIM * DisplayZoom.MAGNIFICATION,
+                            DisplayZoom.ZOOM_DIM * DisplayZoom.MAGNIFICATION)
 
     def paintEvent(self, ev):
         """
@@ -42,6 +90,5 @@ class DisplayZoom(QtWidgets.QWidget):
 
         painter = QtGui.QPainter()
         painter.begin(self)
-        painter.drawPixmap(0, 0, self.image)
+        painter.drawImage(0, 0, self.image)
         painter.end()
-
@@ -1,21 +1,27 @@
+import time
 from argparse import ArgumentParser
 from os.path import exists
-import cv2
 import numpy as np
 from PySide2 import (
         QtWidgets,
         QtCore,
         QtGui,
         )
+from flysight.codec import ENCODINGS
 from flysight.config import Config
 from flysight.client import Client
+from flysight.client.detection import DetectionWorker
+from flysight.client.detection_store import DetectionStore
+from flysight.client.playback import Playback
 from flysight.client.display_main import DisplayMain
+from flysight.client.prefetch import Frame, FrameCache, Prefetcher
 from flysight.client.display_zoom import DisplayZoom
 from flysight.client.display_table import (
         TrackerTableView,
         TrackerTableModel,
         )
 from flysight.client.resource_loader import Resource
+from flysight.video import VideoReader
 
 
 class MainDisplay(QtWidgets.QMainWindow):
@@ -32,10 +38,26 @@ class MainDisplay(QtWidgets.QMainWindow):
         self.frame_width  = 0
         self.frame_height = 0
         self.reader       = None
+        self.video        = None
+        self.playback     = None
 
         # Initialize the ZMQ socket connection.
-        self.client = Client('tcp://127.0.0.1:{}'.format(
-                                Config.Instance.networking.port))
+        self.client = create_client()
+
+        # Detection runs on a worker thread, so the UI never waits on it.
+        self.detection = DetectionWorker(self.client, self)
+        self.detection.detected.connect(self.detected)
+        self.detection.failed.connect(self.detection_failed)
+        self.detection.start()
+
+        # Frames around the displayed one are fetched in the background, see
+        # `load_video`.
+        prefetch = Config.Instance.client.prefetch
+        self.cache = FrameCache(prefetch.cache_bytes)
+        self.prefetcher = None
+
+        # Detections persisted on disk for the video, see `load_video`.
+        self.store = None
 
         # Configure UI
         self.setup_ui()
@@ -47,17 +69,53 @@ class MainDisplay(QtWidgets.QMainWindow):
         self.changed_frame_index()
 
     def load_video(self, video):
-        # Construct the OpenCV video capture object and extract some relevant
+        self.stop_playback()
+
+        # A detection of the previous video must not reach the new store.
+        self.detection.cancel()
+
+        # Construct the video reader object and extract some relevant
         # metadata which can be used to initialize various window sizes.
-        self.reader = cv2.VideoCapture(video)
-        self.frame_count  = self.reader.get(cv2.CAP_PROP_FRAME_COUNT)
-        self.frame_width  = self.reader.get(cv2.CAP_PROP_FRAME_WIDTH)
-        self.frame_height = self.reader.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        if self.reader is not None:
+            self.reader.close()
+
+        self.video = video
+        self.reader = VideoReader.Open(video)
+        self.frame_count  = self.reader.frame_count
+        self.frame_width  = self.reader.cols
+        self.frame_height = self.reader.rows
         self.resize(self.frame_width - 256, self.frame_height)
 
         self.slider.setMaximum(self.frame_count)
+
+        self.close_prefetcher()
+        self.cache.clear()
+
+        if self.store is not None:
+            self.store.flush()
+            self.store = None
+        if Config.Instance.client.disk_cache.enabled:
+            self.store = DetectionStore.Open(video, self.frame_count,
+                                             self.client)
+
+        prefetch = Config.Instance.client.prefetch
+        if prefetch.enabled:
+            self.prefetcher = Prefetcher(video,
+                                         create_client(shared_memory=False),
+                                         self.cache,
+                                         prefetch.ahead,
+                                         prefetch.behind,
+                                         self.store,
+                                         prefetch.batch_size,
+                                         prefetch.depth)
+
         self.changed_frame_index()
 
+    def close_prefetcher(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+
     def setup_ui(self):
         """
         Laborious UI configuration.
@@ -148,8 +206,7 @@ class MainDisplay(QtWidgets.QMainWindow):
 
         # Add the main display.
         self.display = \
-                DisplayMain(self, self.client, self.frame_width,
-                            self.frame_height)
+                DisplayMain(self, self.frame_width, self.frame_height)
         self.layout.addWidget(self.display, 1, 0, 2, 2)
 
         # {
@@ -177,6 +234,10 @@ class MainDisplay(QtWidgets.QMainWindow):
         menu_save.setShortcut(QtGui.QKeySequence('Ctrl+S'))
         menu_save.triggered.connect(self.save_image)
 
+        menu_play = options.addAction('Play')
+        menu_play.setShortcut(QtGui.QKeySequence('Space'))
+        menu_play.triggered.connect(self.toggle_playback)
+
         menu_exit = options.addAction('Exit')
         menu_exit.setShortcut(QtGui.QKeySequence('Ctrl+Q'))
         menu_exit.triggered.connect(QtWidgets.QApplication.quit)
@@ -215,15 +276,121 @@ class MainDisplay(QtWidgets.QMainWindow):
             return
 
         frame_idx = int(self.lcd.value())
-        self.reader.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
 
-        (status, image) = self.reader.read()
-        if not status:
-            print('Failed to read from video stream.')
+        # Frames which were prefetched, or detected in an earlier session,
+        # are displayed immediately.  Otherwise the image is shown and its
+        # detections follow, see `detected`.
+        frame = self.cache.get(frame_idx)
+        if frame is None:
+            image = self.reader.read(frame_idx)
+            detections = None
+            if image is not None and self.store is not None:
+                detections = self.store.get(frame_idx)
+
+            if image is None:
+                print('Failed to read from video stream.')
+            elif detections is not None:
+                self.detection.cancel()
+                frame = Frame(image, *detections)
+                self.cache.put(frame_idx, frame)
+                self.display.set_frame(frame_idx, *frame)
+            else:
+                self.display.load_image(frame_idx, image)
+                self.detection.request(frame_idx, image)
         else:
-            self.display.load_image(frame_idx, image)
+            self.detection.cancel()
+            self.display.set_frame(frame_idx, *frame)
+
+        if self.prefetcher is not None:
+            self.prefetcher.seek(frame_idx)
+
+        self.load_table()
+
+    def detected(self, frame_idx: int, image: np.array, heatmap: np.array,
+                 peaks: list):
+        """
+        SLOT for the detections of a frame, which may no longer be the one
+        displayed.
+        """
+        self.cache.put(frame_idx, Frame(image, heatmap, peaks))
+        if self.store is not None:
+            self.store.put(frame_idx, heatmap, peaks)
+
+        if frame_idx == int(self.lcd.value()):
+            self.display.set_frame(frame_idx, image, heatmap, peaks)
+            self.load_table()
+
+    def toggle_playback(self):
+        """
+        Start playing from the current frame, or stop playing.
+        """
+        if self.playback is not None:
+            self.stop_playback()
+            return
+
+        if self.reader is None:
+            return
 
-        # Load the peaks table.
+        self.detection.cancel()
+
+        playback = Config.Instance.client.playback
+        self.playback = Playback(self.video,
+                                 int(self.lcd.value()),
+                                 create_client(),
+                                 playback.realtime,
+                                 playback.queue_size,
+                                 self.store,
+                                 self)
+        self.playback.ready.connect(self.played_frame)
+        self.playback.finished.connect(self.stop_playback)
+        self.playback.start()
+
+    def played_frame(self):
+        """
+        SLOT for the next frame of the playback.  It is painted immediately,
+        which is what the render latency measures.  The peaks table is left
+        alone until playback stops.
+        """
+        if self.playback is None:
+            return
+
+        frame = self.playback.take()
+        if frame is None:
+            return
+
+        start = time.perf_counter()
+        frame_idx = frame[0]
+
+        # Move the slider without loading the frame again.
+        self.slider.blockSignals(True)
+        self.slider.setValue(frame_idx)
+        self.slider.blockSignals(False)
+        self.lcd.display(frame_idx)
+
+        self.display.set_frame(*frame)
+        self.display.osd = self.playback.osd()
+        self.display.repaint()
+
+        self.playback.rendered_frame((time.perf_counter() - start) * 1000.)
+
+    def stop_playback(self):
+        if self.playback is None:
+            return
+
+        self.playback.stop()
+        self.playback = None
+        self.display.osd = []
+
+        # Back to stepping, from the frame playback stopped at.
+        self.changed_frame_index()
+
+    def detection_failed(self, frame_idx: int, message: str):
+        print('Detection of frame {} failed: {}'.format(frame_idx, message))
+
+    def load_table(self):
+        """
+        Load the peaks table.
+        """
         self.table.load_data(list(enumerate(self.display.peaks)))
         self.table_view.resizeColumnsToContents()
         self.table_view.resizeRowsToContents()
@@ -265,6 +432,33 @@ class MainDisplay(QtWidgets.QMainWindow):
             self.load_video(path)
 
 
+def create_client(shared_memory: bool = True) -> Client:
+    """
+    A client of the local server configured from `Config`.  Without
+    `shared_memory` no ring is allocated, for clients which only call
+    `detect_many`, which never uses one.
+    """
+    client = Client('tcp://127.0.0.1:{}'.format(
+                        Config.Instance.networking.port))
+
+    # The display stretches the heatmap over the frame itself, so a native
+    # heatmap needs no upsampling anywhere.
+    client.heatmap_encoding = \
+            ENCODINGS[Config.Instance.client.heatmap_encoding]
+    client.upsample_heatmap = not Config.Instance.client.native_heatmap
+    client.zero_copy = Config.Instance.networking.zero_copy
+    client.timeout_ms = Config.Instance.client.timeout_ms
+    client.regions = [tuple(roi) for roi in Config.Instance.client.regions]
+    client.motion = Config.Instance.client.motion
+
+    # The server is always started on this host, see `flysight.run`.
+    ring = Config.Instance.networking.shared_memory
+    if shared_memory and ring.enabled:
+        client.use_shared_memory(ring.slots, ring.max_pixels)
+
+    return client
+
+
 def main(video: str):
     """
     A localized `main` function for the client application.
@@ -273,6 +467,14 @@ def main(video: str):
     main = MainDisplay(video)
     main.show()
     app.exec_()
+    main.stop_playback()
+    main.detection.stop()
+    main.close_prefetcher()
+    if main.store is not None:
+        main.store.flush()
+    main.client.close()
+    if main.reader is not None:
+        main.reader.close()
 
 if __name__ == '__main__':
     argp = ArgumentParser()
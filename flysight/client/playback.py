@@ -0,0 +1,203 @@
+"""
+Continuous playback.  Decoding, detection and rendering run as overlapped
+stages:
+
+    decode thread --[queue]--> detect thread --[mailbox]--> GUI thread
+
+The queue between decoding and detection is bounded.  When it is full, the
+oldest frame is dropped.  The mailbox holds a single frame, and a frame the GUI
+has not taken yet is replaced by the next one.  A slow stage therefore costs
+frames, not latency.
+"""
+import threading
+import time
+from collections import deque
+from queue import Empty, Full, Queue
+from PySide2 import QtCore
+from flysight.client.client import Client
+from flysight.client.detection_store import DetectionStore
+from flysight.client.prefetch import fetch
+from flysight.video import VideoReader
+
+# Marks the end of the video in the queue.
+END = None
+
+
+class Playback(QtCore.QObject):
+    """
+    :class Playback:
+
+    Plays `video` from `start`, at its nominal frame rate when `realtime` is
+    set, otherwise as fast as the stages allow.  Detections are taken from,
+    and written back to, the optional `store`.  `ready` is emitted whenever
+    a frame is waiting in the mailbox (see `take`), and `finished` at the end
+    of the video.
+    """
+    ready = QtCore.Signal()
+    finished = QtCore.Signal()
+
+    # Window over which the achieved frame rate is measured, in seconds.
+    FPS_WINDOW = 1.
+
+    def __init__(self, video: str, start: int, client: Client,
+                 realtime: bool, queue_size: int,
+                 store: DetectionStore = None, parent=None):
+        super().__init__(parent)
+        self.reader = VideoReader.Open(video)
+        self.client = client
+        self.store = store
+        self.start_idx = start
+        self.realtime = realtime and self.reader.fps > 0
+
+        self.decoded = Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+
+        # {
+        # Single frame mailbox to the GUI thread.
+        self.lock = threading.Lock()
+        self.mailbox = None
+        # }
+
+        # {
+        # Statistics; per stage latency in milliseconds (exponentially
+        # smoothed), frames dropped, and the times frames were rendered.
+        self.latency = {'decode': 0., 'detect': 0., 'render': 0.}
+        self.dropped = 0
+        self.rendered = deque()
+        # }
+
+        self.threads = [
+            threading.Thread(target=self.decode),
+            threading.Thread(target=self.detect),
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """
+        Stop the stages and release their resources.
+        """
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+        self.client.close()
+        self.reader.close()
+
+    def take(self):
+        """
+        The latest detected frame as (frame_idx, image, heatmap, peaks), or
+        None if there is none (or the video ended, see `finished`).
+        """
+        with self.lock:
+            (frame, self.mailbox) = (self.mailbox, None)
+            return frame
+
+    def record(self, stage: str, milliseconds: float):
+        previous = self.latency[stage]
+        if previous:
+            milliseconds = 0.9 * previous + 0.1 * milliseconds
+        self.latency[stage] = milliseconds
+
+    def rendered_frame(self, render_ms: float):
+        """
+        To be called by the GUI once it has drawn a frame from `take`.
+        """
+        now = time.monotonic()
+        self.record('render', render_ms)
+
+        self.rendered.append(now)
+        while now - self.rendered[0] > self.FPS_WINDOW:
+            self.rendered.popleft()
+
+    def fps(self) -> float:
+        if len(self.rendered) < 2:
+            return 0.
+        return (len(self.rendered) - 1) \
+             / max(self.rendered[-1] - self.rendered[0], 1e-6)
+
+    def osd(self) -> [str]:
+        """
+        Lines of the on screen display.
+        """
+        return [
+            '{:5.1f} fps  ({} dropped)'.format(self.fps(), self.dropped),
+            'decode {:6.1f} ms'.format(self.latency['decode']),
+            'detect {:6.1f} ms'.format(self.latency['detect']),
+            'render {:6.1f} ms'.format(self.latency['render']),
+        ]
+
+    def put(self, item):
+        """
+        Queue `item` for detection, dropping the oldest queued frame when
+        full.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.decoded.put_nowait(item)
+                return
+            except Full:
+                pass
+
+            try:
+                if self.decoded.get_nowait() is not END:
+                    self.dropped += 1
+            except Empty:
+                pass
+
+    def decode(self):
+        """
+        Stage 1; decode sequentially, paced to the frame rate if `realtime`.
+        """
+        interval = 1. / self.reader.fps if self.realtime else 0.
+        began = time.monotonic()
+
+        frame_idx = self.start_idx
+        while not self.stopped.is_set():
+            if interval:
+                delay = began + (frame_idx - self.start_idx) * interval \
+                      - time.monotonic()
+                if delay > 0:
+                    self.stopped.wait(delay)
+
+            start = time.perf_counter()
+            image = self.reader.read(frame_idx)
+            self.record('decode', (time.perf_counter() - start) * 1000.)
+
+            if image is None:
+                break
+
+            self.put((frame_idx, image))
+            frame_idx += 1
+
+        self.put(END)
+
+    def detect(self):
+        """
+        Stage 2; detect and post the result to the mailbox.
+        """
+        while not self.stopped.is_set():
+            try:
+                item = self.decoded.get(timeout=0.1)
+            except Empty:
+                continue
+
+            if item is END:
+                self.finished.emit()
+                break
+
+            (frame_idx, image) = item
+            start = time.perf_counter()
+            detections = fetch(self.client, self.store, frame_idx, image)
+            (heatmap, peaks) = detections or (None, [])
+            self.record('detect', (time.perf_counter() - start) * 1000.)
+
+            with self.lock:
+                if self.mailbox is not None:
+                    self.dropped += 1
+                self.mailbox = (frame_idx, image, heatmap, peaks)
+
+            self.ready.emit()
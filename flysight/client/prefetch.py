@@ -0,0 +1,252 @@
+"""
+Background prefetching of the frames around the one displayed, so that
+stepping through a video is served from memory rather than paying for decoding
+and detection on every step.
+"""
+import threading
+from collections import OrderedDict, deque, namedtuple
+import numpy as np
+from flysight.client.client import Client
+from flysight.client.detection_store import DetectionStore
+from flysight.video import VideoReader
+
+# A decoded frame with its detection results.
+Frame = namedtuple('Frame', ['image', 'heatmap', 'peaks'])
+
+
+def frame_nbytes(frame: Frame) -> int:
+    nbytes = frame.image.nbytes + 16 * len(frame.peaks)
+    if frame.heatmap is not None:
+        nbytes += frame.heatmap.nbytes
+    return nbytes
+
+
+def fetch(client: Client, store: DetectionStore, frame_idx: int,
+          image: np.array) -> (np.array, [(float, float)]):
+    """
+    The (heatmap, peaks) of a frame from the `store` if it is there, otherwise
+    detected by the `client` and written to the `store`.  None if the
+    detection failed, so that a failure costs a single frame.
+    """
+    detections = None
+    if store is not None:
+        detections = store.get(frame_idx)
+    if detections is not None:
+        return detections
+
+    try:
+        (heatmap, peaks) = client.detect(image)
+    except TimeoutError as err:
+        print('Detection of frame {} failed: {}'.format(frame_idx, err))
+        return None
+    except Exception as err:
+        # A malformed or error reply; the socket may be left waiting for a
+        # reply, so it is reconnected.
+        client.reset()
+        print('Detection of frame {} failed: {}: {}'.format(
+                frame_idx, type(err).__name__, err))
+        return None
+
+    if store is not None:
+        store.put(frame_idx, heatmap, peaks)
+
+    return (heatmap, peaks)
+
+
+class FrameCache:
+    """
+    :class FrameCache:
+
+    Thread safe LRU of `Frame` keyed by frame index, holding at most
+    `max_bytes` of pixel data.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, frame_idx: int) -> bool:
+        with self.lock:
+            return frame_idx in self.frames
+
+    def get(self, frame_idx: int) -> Frame:
+        """
+        The cached frame, marked as most recently used, or None.
+        """
+        with self.lock:
+            frame = self.frames.get(frame_idx)
+            if frame is not None:
+                self.frames.move_to_end(frame_idx)
+            return frame
+
+    def put(self, frame_idx: int, frame: Frame):
+        with self.lock:
+            previous = self.frames.pop(frame_idx, None)
+            if previous is not None:
+                self.nbytes -= frame_nbytes(previous)
+
+            self.frames[frame_idx] = frame
+            self.nbytes += frame_nbytes(frame)
+
+            while self.nbytes > self.max_bytes and len(self.frames) > 1:
+                (_, evicted) = self.frames.popitem(last=False)
+                self.nbytes -= frame_nbytes(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.nbytes = 0
+
+
+class Prefetcher:
+    """
+    :class Prefetcher:
+
+    Decodes and detects the frames around the current position on a thread of
+    its own, with its own video reader and `Client`, into a `FrameCache`.
+    Detections found in the optional `DetectionStore` are not requested, and
+    the others are written back to it.
+
+    The `ahead` frames after the position come first, read sequentially, then
+    the `behind` frames before it, read from a single seek (see
+    `VideoReader`).  A new position
+    (see `seek`) restarts the plan.  No more frames are planned than the cache
+    can hold.
+
+    Frames are detected `batch_size` to a request, with up to `depth`
+    requests in flight (see `Client.detect_many`), while the following frames
+    are decoded.
+    """
+    def __init__(self, video: str, client: Client, cache: FrameCache,
+                 ahead: int, behind: int, store: DetectionStore = None,
+                 batch_size: int = 1, depth: int = 1):
+        self.reader = VideoReader.Open(video)
+        self.frame_count = self.reader.frame_count
+        self.client = client
+        self.cache = cache
+        self.store = store
+        self.ahead = ahead
+        self.behind = behind
+        self.batch_size = batch_size
+        self.depth = depth
+
+        self.position = 0
+        self.stopped = False
+
+        # Frames which could not be decoded or detected, not tried again.
+        self.failed = set()
+        self.frame_bytes = 0
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def seek(self, frame_idx: int):
+        """
+        Prefetch around `frame_idx` from now on.
+        """
+        with self.condition:
+            self.position = frame_idx
+            self.condition.notify()
+
+    def close(self):
+        """
+        Stop the thread, and close its client.
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        self.thread.join()
+        self.client.close()
+        self.reader.close()
+
+    def plan(self, count: int = 1) -> [int]:
+        """
+        The next `count` (at most) frames to fetch, in order, none if the
+        window is complete.
+        """
+        window = list(range(self.position + 1,
+                            min(self.position + 1 + self.ahead,
+                                self.frame_count))) \
+               + list(range(max(self.position - self.behind, 0),
+                            self.position))
+
+        # Leave room for the frame on display.
+        if self.frame_bytes:
+            window = window[:self.cache.max_bytes // self.frame_bytes - 1]
+
+        planned = []
+        for frame_idx in window:
+            if len(planned) == count:
+                break
+            if frame_idx not in self.failed and frame_idx not in self.cache:
+                planned.append(frame_idx)
+
+        return planned
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopped:
+                    planned = self.plan(self.batch_size * self.depth)
+                    if planned:
+                        break
+                    self.condition.wait()
+
+                if self.stopped:
+                    break
+
+                position = self.position
+
+            # Decoded frames whose detections are not in the store, in the
+            # order they are sent to be detected.
+            pending = deque()
+
+            def decoded():
+                """
+                Decode the planned frames, as long as the position holds.
+                """
+                for frame_idx in planned:
+                    if self.stopped or self.position != position:
+                        return
+
+                    image = self.reader.read(frame_idx)
+                    if image is None:
+                        self.failed.add(frame_idx)
+                        continue
+
+                    detections = None
+                    if self.store is not None:
+                        detections = self.store.get(frame_idx)
+                    if detections is not None:
+                        self.put(frame_idx, image, *detections)
+                        continue
+
+                    pending.append((frame_idx, image))
+                    yield image
+
+            try:
+                for (heatmap, peaks) in self.client.detect_many(
+                        decoded(), self.batch_size, self.depth):
+                    (frame_idx, image) = pending.popleft()
+                    if self.store is not None:
+                        self.store.put(frame_idx, heatmap, peaks)
+                    self.put(frame_idx, image, heatmap, peaks)
+            except TimeoutError as err:
+                print('Prefetching failed: {}'.format(err))
+            except Exception as err:
+                # An error reply, or a malformed one.  The frames in flight
+                # are not retried, so that a persistent error does not spin.
+                print('Prefetching failed: {}: {}'.format(
+                        type(err).__name__, err))
+                self.failed.update(frame_idx for (frame_idx, _) in pending)
+                self.client.reset()
+
+    def put(self, frame_idx: int, image: np.array, heatmap: np.array,
+            peaks: [(float, float)]):
+        frame = Frame(image, heatmap, peaks)
+        self.frame_bytes = frame_nbytes(frame)
+        self.cache.put(frame_idx, frame)
@@ -0,0 +1,91 @@
+"""
+Multi-resolution tiles of an image, so that a view of any part of it at any
+scale draws a bounded number of pixels.
+
+Level 0 is the image itself and each further level halves the one before.
+Levels are built on first use, and each level is cut into `TILE` squared
+tiles, also on first use.
+"""
+import math
+import cv2
+import numpy as np
+
+
+class Pyramid:
+    """
+    :class Pyramid:
+
+    The mip pyramid of a 2D image.  A pixel of level `k` covers 2**k squared
+    pixels of the image.
+    """
+    TILE = 256
+
+    def __init__(self, image: np.array):
+        self.levels = [image]
+        self.tiles = {}
+
+        # Halve until the coarsest level fits in a single tile.
+        self.depth = 1 + max(0, math.ceil(math.log2(max(image.shape[:2])
+                                                    / self.TILE)))
+
+    def level(self, k: int) -> np.array:
+        """
+        Level `k`, building it (and the levels before it) if needed.
+        """
+        while len(self.levels) <= k:
+            previous = self.levels[-1]
+            rows = max(previous.shape[0] // 2, 1)
+            cols = max(previous.shape[1] // 2, 1)
+
+            # An even crop makes every pixel the mean of exactly four.
+            self.levels.append(cv2.resize(previous[:rows * 2, :cols * 2],
+                                          (cols, rows),
+                                          interpolation=cv2.INTER_AREA))
+
+        return self.levels[k]
+
+    def select(self, scale: float) -> int:
+        """
+        The coarsest level with at least one pixel per display pixel when the
+        image is displayed at `scale` display pixels per image pixel.
+        """
+        if scale >= 1.:
+            return 0
+        return min(int(math.log2(1. / scale)), self.depth - 1)
+
+    def tile(self, k: int, row: int, col: int) -> np.array:
+        """
+        The tile at (`row`, `col`) of the tile grid of level `k`, as a
+        contiguous array.
+        """
+        key = (k, row, col)
+        tile = self.tiles.get(key)
+        if tile is None:
+            level = self.level(k)
+            tile = np.ascontiguousarray(
+                    level[row * self.TILE:(row + 1) * self.TILE,
+                          col * self.TILE:(col + 1) * self.TILE])
+            self.tiles[key] = tile
+
+        return tile
+
+    def visible(self, k: int, top: float, left: float, bottom: float,
+                right: float) -> [(int, int, np.array)]:
+        """
+        The tiles of level `k` which overlap the region of the image (in
+        image pixels) as (top, left, tile), with the position of the tile in
+        image pixels.
+        """
+        level = self.level(k)
+        factor = 2 ** k
+        span = self.TILE * factor
+
+        rows = range(max(int(top // span), 0),
+                     min(int(math.ceil(bottom / span)),
+                         -(-level.shape[0] // self.TILE)))
+        cols = range(max(int(left // span), 0),
+                     min(int(math.ceil(right / span)),
+                         -(-level.shape[1] // self.TILE)))
+
+        return [(row * span, col * span, self.tile(k, row, col))
+                for row in rows for col in cols]
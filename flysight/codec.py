@@ -0,0 +1,146 @@
+"""
+Packing and unpacking of images and heatmaps to and from the `Image` protobuf
+message, shared by the client and the server.
+
+Every function accepts an optional `frames` list.  When given, the pixel data
+travels as a separate ZMQ frame (see `Image.frame`); encoding appends the
+buffer to `frames`, decoding wraps the buffer it indexes without copying.
+
+The encoders also accept a `shared` slot of a `SharedRing`.  The data is then
+written into shared memory, falling back to `frames` (or inline data) when it
+does not fit the slot.  Decoded data may be a view of the shared slot.
+"""
+import numpy as np
+from flysight.message_pb2 import (
+        Image,
+        FLOAT32,
+        FLOAT16,
+        UINT8,
+        )
+from flysight.shared_ring import SharedRing, SharedSlot
+
+# Numpy element type for each `Encoding`.
+DTYPES = {
+    FLOAT32: np.float32,
+    FLOAT16: np.float16,
+    UINT8:   np.uint8,
+}
+
+# `Encoding` for each configuration name.
+ENCODINGS = {
+    'float32': FLOAT32,
+    'float16': FLOAT16,
+    'uint8':   UINT8,
+}
+
+
+def encode_image(
+        image: np.array,
+        msg: Image,
+        frames: list = None,
+        shared: SharedSlot = None):
+    """
+    Store the 2D uint8 `image` into `msg`.
+    """
+    msg.rows = image.shape[0]
+    msg.cols = image.shape[1]
+    store(np.ascontiguousarray(image), msg, frames, shared, SharedRing.FRAME)
+
+
+def decode_image(msg: Image, frames: list = None) -> np.array:
+    """
+    Inverse of `encode_image`.  The returned array is read-only.
+    """
+    nbytes = msg.rows * msg.cols
+    return np.frombuffer(load(msg, frames, SharedRing.FRAME, nbytes),
+                         dtype=np.uint8
+                        ).reshape(msg.rows, msg.cols)
+
+
+def encode_heatmap(
+        heatmap: np.array,
+        encoding: int,
+        msg: Image,
+        frames: list = None,
+        shared: SharedSlot = None):
+    """
+    Store the 2D float32 `heatmap` into `msg` using `encoding`.  The `UINT8`
+    encoding quantizes linearly over the [min, max] range of the heatmap.
+    """
+    msg.rows = heatmap.shape[0]
+    msg.cols = heatmap.shape[1]
+    msg.encoding = encoding
+
+    if encoding == UINT8:
+        (data, msg.scale, msg.offset) = quantize(heatmap)
+    else:
+        data = heatmap.astype(DTYPES[encoding], copy=False)
+
+    store(np.ascontiguousarray(data), msg, frames, shared, SharedRing.HEATMAP)
+
+
+def quantize(heatmap: np.array) -> (np.array, float, float):
+    """
+    Quantize `heatmap` linearly over its [min, max] range to uint8, returning
+    the data, the scale and the offset; value = data * scale + offset.
+    """
+    lo = float(heatmap.min())
+    hi = float(heatmap.max())
+    scale = (hi - lo) / 255. if hi > lo else 1.
+    data = np.rint((heatmap - lo) * (1. / scale)).astype(np.uint8)
+    return (data, scale, lo)
+
+
+def decode_heatmap(msg: Image, frames: list = None) -> np.array:
+    """
+    Inverse of `encode_heatmap`, always returns a 2D float32 heatmap.
+    """
+    dtype = np.dtype(DTYPES[msg.encoding])
+    nbytes = msg.rows * msg.cols * dtype.itemsize
+    data = np.frombuffer(load(msg, frames, SharedRing.HEATMAP, nbytes),
+                         dtype=dtype
+                        ).reshape(msg.rows, msg.cols)
+
+    if msg.encoding == UINT8:
+        return data * np.float32(msg.scale) + np.float32(msg.offset)
+
+    return data.astype(np.float32, copy=False)
+
+
+def store(
+        data: np.array,
+        msg: Image,
+        frames: list = None,
+        shared: SharedSlot = None,
+        region: int = SharedRing.FRAME):
+    """
+    Attach the contiguous array `data` to `msg`; in `region` of the `shared`
+    slot, as a frame, or inline, in that order of preference.
+    """
+    if shared is not None and shared.ring.fits(region, data.nbytes):
+        view = shared.ring.view(shared.slot, region, data.nbytes)
+        np.frombuffer(view, dtype=np.uint8)[:] = \
+                data.reshape(-1).view(np.uint8)
+        msg.shared_memory = shared.ring.name
+        msg.slot = shared.slot
+    elif frames is not None:
+        msg.frame = len(frames)
+        frames.append(data)
+    else:
+        msg.data = data.tobytes()
+
+
+def load(msg: Image, frames: list, region: int, nbytes: int):
+    """
+    Return a buffer over the `nbytes` of data attached to `msg`.  Frames may
+    be raw buffers or `zmq.Frame` objects.
+    """
+    if msg.HasField('shared_memory'):
+        ring = SharedRing.Attach(msg.shared_memory)
+        return ring.view(msg.slot, region, nbytes)
+
+    if msg.HasField('frame'):
+        frame = frames[msg.frame]
+        return getattr(frame, 'buffer', frame)
+
+    return msg.data
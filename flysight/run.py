@@ -4,6 +4,7 @@ from os.path import dirname, join
 from flysight.config import Config
 from flysight.client.main import main as client_main
 from flysight.server.main import main as server_main
+from flysight.server import broker
 
 
 def main(argv=None):
@@ -23,13 +24,25 @@ def main(argv=None):
     Config.Load(path)
 
     # Initialize the server in a separate process, we set the `daemon` parameter
-    # since it makes it life easier on shutdown.
-    server_handle = Process(target=server_main)
-    server_handle.daemon = True
-    server_handle.start()
+    # since it makes it life easier on shutdown.  In `broker` mode the broker
+    # and each of its workers are separate processes.
+    if Config.Instance.server.mode == 'broker':
+        server_handles = broker.spawn()
+    else:
+        server_handle = Process(target=server_main)
+        server_handle.daemon = True
+        server_handle.start()
+        server_handles = [server_handle]
 
     # Start the client GUI.
-    client_main(args.video)
+    try:
+        client_main(args.video)
+    finally:
+        # The server processes never exit on their own.
+        for handle in server_handles:
+            handle.terminate()
+        for handle in server_handles:
+            handle.join()
 
 if __name__ == '__main__':
     main()
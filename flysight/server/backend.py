@@ -0,0 +1,272 @@
+"""
+Inference runtimes behind `FlyCentroidDetector`.
+
+Every backend evaluates the same learned `model.h5`.  The lighter runtimes
+(`tflite`, `onnx`) convert it once and cache the artifact next to the model;
+after that they never import tensorflow.
+"""
+import os
+import urllib.request
+from contextlib import contextmanager
+from os import makedirs
+from os.path import exists, join, splitext
+import cv2
+import numpy as np
+
+
+@contextmanager
+def staged(path: str):
+    """
+    Yield a temporary path next to `path` to write to, and move it into place
+    only once writing succeeded.  An interrupted download or conversion never
+    leaves a truncated `path` behind, which would otherwise be taken for the
+    cached artifact from then on.
+    """
+    partial = '{}.{}.part'.format(path, os.getpid())
+    try:
+        yield partial
+        os.replace(partial, path)
+    finally:
+        if exists(partial):
+            os.remove(partial)
+
+
+def fetch_model(url: str, cache: str) -> str:
+    """
+    Download the model into the `cache` directory unless it already exists,
+    and return its path.
+    """
+    path = join(cache, 'model.h5')
+    if not exists(path):
+        makedirs(cache, exist_ok=True)
+        with staged(path) as partial:
+            urllib.request.urlretrieve(url, partial)
+
+    return path
+
+
+class Backend:
+    """
+    :class Backend:
+
+    Interface of an inference runtime.  Use `Backend.Create` to instantiate one
+    by name.
+    """
+    # Spatial dimensions of the model input.
+    INPUT_DIM = (512, 512)
+
+    @staticmethod
+    def Create(name: str, model_path: str, threads: int = None) -> 'Backend':
+        """
+        Construct the backend called `name` for the model at `model_path`.
+        `threads` optionally restricts the number of threads it may use.
+        """
+        backends = {
+            'tensorflow': TensorFlowBackend,
+            'tflite':     TFLiteBackend,
+            'onnx':       OnnxBackend,
+        }
+        if name not in backends:
+            raise ValueError('Unknown inference backend: %s' % name)
+
+        return backends[name](model_path, threads)
+
+    def infer(self, X: np.array, upsample: bool) -> np.array:
+        """
+        Given a batch `X` of uint8 images of shape [N, rows, cols, 1], return
+        the float32 heatmaps of shape [N, 512, 512, 1].  If `upsample` is set
+        the heatmaps are resized back to [N, rows, cols, 1].
+        """
+        raise NotImplementedError()
+
+    def warmup(self):
+        """
+        Evaluate a blank frame so that one-time setup is not paid by the first
+        real request.
+        """
+        X = np.zeros((1, ) + self.INPUT_DIM + (1, ), dtype=np.uint8)
+        self.infer(X, False)
+        self.infer(X, True)
+
+    @staticmethod
+    def preprocess(X: np.array) -> np.array:
+        """
+        Scale a [N, rows, cols, 1] uint8 batch to [0, 1] and resize it to the
+        model dimensions.  Used by the backends without a fused graph.
+        """
+        rows, cols = Backend.INPUT_DIM
+        Y = np.empty((len(X), rows, cols, 1), dtype=np.float32)
+        for (img, y) in zip(X, Y):
+            y[:, :, 0] = cv2.resize(img, (cols, rows),
+                                    interpolation=cv2.INTER_LINEAR)
+
+        Y *= 1. / 255.
+        return Y
+
+    @staticmethod
+    def postprocess(Y: np.array, shape: (int, int)) -> np.array:
+        """
+        Resize a [N, 512, 512, 1] batch of heatmaps to `shape` (rows, cols).
+        """
+        rows, cols = shape
+        Z = np.empty((len(Y), rows, cols, 1), dtype=np.float32)
+        for (heatmap, z) in zip(Y, Z):
+            z[:, :, 0] = cv2.resize(heatmap, (cols, rows),
+                                    interpolation=cv2.INTER_LINEAR)
+
+        return Z
+
+
+class TensorFlowBackend(Backend):
+    """
+    :class TensorFlowBackend:
+
+    Evaluates the keras model through traced `tf.function` graphs.
+    """
+    def __init__(self, model_path: str, threads: int = None):
+        import tensorflow as tf
+
+        if threads:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+
+        # Every inference graph accepts a batch of single channel uint8 images
+        # of any (but uniform) size.  Keeping the signature fixed means the
+        # graph is traced exactly once.  Calling the model directly avoids the
+        # data adapter and iterator `model.predict` constructs on every call.
+        signature = [tf.TensorSpec([None, None, None, 1], tf.uint8)]
+        self.__infer = tf.function(
+                self.__graph,
+                input_signature=signature,
+                autograph=False)
+        self.__infer_upsampled = tf.function(
+                self.__graph_upsampled,
+                input_signature=signature,
+                autograph=False)
+
+    def infer(self, X: np.array, upsample: bool) -> np.array:
+        infer = self.__infer_upsampled if upsample else self.__infer
+        return infer(X).numpy()
+
+    def __graph(self, X):
+        """
+        Preprocessing and prediction fused in a single graph.
+        """
+        import tensorflow as tf
+
+        # Scale to [0, 1]
+        X = tf.cast(X, tf.float32) / 255.
+
+        # Normalize to fixed dimensions.
+        X = tf.image.resize(X, size=self.INPUT_DIM)
+
+        return self.model(X, training=False)
+
+    def __graph_upsampled(self, X):
+        """
+        As `__graph`, additionally resizing the heatmap back to the input
+        dimensions.
+        """
+        import tensorflow as tf
+        return tf.image.resize(self.__graph(X), size=tf.shape(X)[1:3])
+
+
+class TFLiteBackend(Backend):
+    """
+    :class TFLiteBackend:
+
+    Evaluates a TFLite conversion of the model.  `tflite_runtime` is preferred
+    over the interpreter bundled with tensorflow when it is installed.
+    """
+    def __init__(self, model_path: str, threads: int = None):
+        path = splitext(model_path)[0] + '.tflite'
+        if not exists(path):
+            self.convert(model_path, path)
+
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=path, num_threads=threads)
+        self.input = self.interpreter.get_input_details()[0]['index']
+        self.output = self.interpreter.get_output_details()[0]['index']
+        self.batch = None
+
+    @staticmethod
+    def convert(model_path: str, path: str):
+        """
+        One-time conversion of the keras model at `model_path` to `path`.
+        """
+        import tensorflow as tf
+        model = tf.keras.models.load_model(model_path, compile=False)
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        with staged(path) as partial:
+            with open(partial, 'wb') as fp:
+                fp.write(converter.convert())
+
+    def infer(self, X: np.array, upsample: bool) -> np.array:
+        # The interpreter tensors have to be reallocated whenever the batch
+        # size changes.
+        if self.batch != len(X):
+            self.interpreter.resize_tensor_input(
+                    self.input, (len(X), ) + self.INPUT_DIM + (1, ))
+            self.interpreter.allocate_tensors()
+            self.batch = len(X)
+
+        self.interpreter.set_tensor(self.input, self.preprocess(X))
+        self.interpreter.invoke()
+        Y = self.interpreter.get_tensor(self.output)
+
+        if upsample:
+            Y = self.postprocess(Y, X.shape[1:3])
+
+        return Y
+
+
+class OnnxBackend(Backend):
+    """
+    :class OnnxBackend:
+
+    Evaluates an ONNX conversion of the model with ONNX Runtime on the CPU.
+    """
+    def __init__(self, model_path: str, threads: int = None):
+        path = splitext(model_path)[0] + '.onnx'
+        if not exists(path):
+            self.convert(model_path, path)
+
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = threads
+
+        self.session = onnxruntime.InferenceSession(
+                path, options, providers=['CPUExecutionProvider'])
+        self.input = self.session.get_inputs()[0].name
+
+    @staticmethod
+    def convert(model_path: str, path: str):
+        """
+        One-time conversion of the keras model at `model_path` to `path`.
+        """
+        import tensorflow as tf
+        import tf2onnx
+        model = tf.keras.models.load_model(model_path, compile=False)
+        signature = [tf.TensorSpec((None, ) + Backend.INPUT_DIM + (1, ),
+                                   tf.float32)]
+        with staged(path) as partial:
+            tf2onnx.convert.from_keras(
+                    model, input_signature=signature, output_path=partial)
+
+    def infer(self, X: np.array, upsample: bool) -> np.array:
+        (Y, ) = self.session.run(None, {self.input: self.preprocess(X)})
+
+        if upsample:
+            Y = self.postprocess(Y, X.shape[1:3])
+
+        return Y
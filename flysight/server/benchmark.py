@@ -0,0 +1,149 @@
+"""
+Micro-benchmarks for the server side detector.  Run as:
+
+    python -m flysight.server.benchmark --frames 100 --rows 1080 --cols 1920 \
+        --backends tensorflow tflite onnx --flies 50
+"""
+import time
+from argparse import ArgumentParser
+from os.path import dirname, join
+import numpy as np
+import tensorflow as tf
+from flysight.config import Config
+from flysight.server.backend import fetch_model
+from flysight.server.peaks import find_peaks, find_peaks_tensorflow
+from flysight.server.solver import FlyCentroidDetector
+
+
+def predict_heatmap(model: tf.keras.Model, img: np.array) -> np.array:
+    """
+    The original per-frame inference path, kept as the benchmark reference.
+    """
+    X = np.expand_dims(img, axis=0).astype("float32") / 255.
+    X = tf.image.resize(X, size=[512, 512])
+    return model.predict(X)
+
+
+def synthetic_heatmap(flies: int, dim: int = 512) -> np.array:
+    """
+    A [1, dim, dim, 1] heatmap of `flies` gaussian blobs at random positions.
+    """
+    (rows, cols) = np.mgrid[:dim, :dim]
+    heatmap = np.zeros((dim, dim), dtype=np.float32)
+    for (row, col) in np.random.uniform(8, dim - 8, size=(flies, 2)):
+        heatmap += np.exp(-((rows - row) ** 2 + (cols - col) ** 2) / 18.)
+
+    return heatmap[np.newaxis, :, :, np.newaxis]
+
+
+def agreement(lhs: np.array, rhs: np.array, tolerance: float) -> float:
+    """
+    Fraction of the `lhs` peaks within `tolerance` (in the same units) of some
+    `rhs` peak.
+    """
+    if not len(lhs):
+        return 1.
+    if not len(rhs):
+        return 0.
+
+    distance = np.linalg.norm(lhs[:, np.newaxis] - rhs[np.newaxis], axis=2)
+    return float(np.mean(distance.min(axis=1) <= tolerance))
+
+
+def measure(fn, frames: int) -> (float, float):
+    """
+    Call `fn` once to warm it up, then `frames` times.  Returns the median and
+    the minimum per-call latency in milliseconds.
+    """
+    fn()
+
+    latencies = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000.)
+
+    return (float(np.median(latencies)), float(np.min(latencies)))
+
+
+def report(name: str, latency: (float, float)):
+    print('{:<32} median {:9.3f} ms   min {:9.3f} ms'.format(name, *latency))
+
+
+def main(argv=None):
+    argp = ArgumentParser()
+    argp.add_argument(
+            '--config',
+            default=None)
+    argp.add_argument(
+            '--frames',
+            type=int,
+            default=50)
+    argp.add_argument(
+            '--rows',
+            type=int,
+            default=1080)
+    argp.add_argument(
+            '--cols',
+            type=int,
+            default=1920)
+    argp.add_argument(
+            '--backends',
+            nargs='+',
+            default=['tensorflow'])
+    argp.add_argument(
+            '--flies',
+            type=int,
+            default=50)
+
+    args = argp.parse_args(argv)
+
+    path = args.config or join(dirname(dirname(__file__)), 'config.yml')
+    Config.Load(path)
+
+    image = np.random.randint(0, 256, size=(args.rows, args.cols, 1),
+                              dtype=np.uint8)
+
+    model = tf.keras.models.load_model(
+                fetch_model(Config.Instance.model.url,
+                            Config.Instance.model.cache),
+                compile=False)
+    report('model.predict',
+           measure(lambda: predict_heatmap(model, image), args.frames))
+
+    for backend in args.backends:
+        Config.Instance.model.backend = backend
+
+        start = time.perf_counter()
+        detector = FlyCentroidDetector()
+        print('{:<32} startup {:8.3f} s'.format(
+                backend, time.perf_counter() - start))
+
+        report(backend,
+               measure(lambda: detector.generate_heatmap(image), args.frames))
+        report(backend + ' + upsample',
+               measure(lambda: detector.generate_heatmap(image, True),
+                       args.frames))
+
+    # Peak finders, on a synthetic heatmap.
+    centroid_detector = Config.Instance.centroid_detector
+    dim = centroid_detector.nonmax_suppression_dim
+    threshold = centroid_detector.coef_maximum_threshold
+    heatmap = synthetic_heatmap(args.flies)
+
+    report('peaks: tensorflow',
+           measure(lambda: find_peaks_tensorflow(heatmap, dim, threshold),
+                   args.frames))
+    report('peaks: numpy',
+           measure(lambda: find_peaks(heatmap, dim, threshold),
+                   args.frames))
+
+    lhs = find_peaks(heatmap, dim, threshold) * 512.
+    rhs = find_peaks_tensorflow(heatmap, dim, threshold) * 512.
+    print('peaks: numpy {} / tensorflow {}, agreement {:.3f} / {:.3f}'.format(
+            len(lhs), len(rhs),
+            agreement(lhs, rhs, 1.), agreement(rhs, lhs, 1.)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+This file implements the multi-worker (`broker`) server mode.
+
+        REQ clients                 workers (DEALER)
+            |                             ^
+            V                             |
+    +---------------+             +---------------+
+    |   frontend    |  -------->  |    backend    |
+    |   (ROUTER)    |  <--------  |   (ROUTER)    |
+    +---------------+             +---------------+
+
+The broker owns no detector.  It forwards each client request to the worker
+with the fewest outstanding requests, and relays the reply back to the client.
+Every worker is a separate process with its own `FlyCentroidDetector`, pinned
+to its own set of cores.
+
+Tracking sessions, and the background models and change gates of streams,
+live inside a worker, so requests naming a session or such a stream are always
+forwarded to the worker which received the first one.  Only the
+`max_affinities` most recently used of them are remembered; a session or
+stream idle for longer is forwarded anew, as the workers would have evicted
+its state by then anyway.
+"""
+import os
+from collections import OrderedDict
+from multiprocessing import Process
+import zmq
+from flysight.config import Config
+from flysight.message_pb2 import Request, ReqDetections
+from flysight.server.main import serve, split_envelope
+from flysight.server.solver import FlyCentroidDetector
+
+# Sent by a worker (as a single frame) once its detector is loaded.
+READY = b'READY'
+
+# First byte of a serialized `Request` holding a tracking, session or
+# statistics request; the tag of its only field.  These are small, and parsed
+# for their session or stream.
+SESSION_TAGS = (b'\x12', b'\x1a', b'\x22')
+
+# Field numbers of the detection requests (single or batched) within a
+# `Request`, and of their options naming the stream.  The batch shares the
+# option field numbers of `ReqDetections`.  Detection requests are scanned for
+# these fields without being parsed, as their images may be inline.
+DETECTIONS_FIELDS = (Request.DESCRIPTOR.fields_by_name['detections'].number,
+                     Request.DESCRIPTOR.fields_by_name['detections_batch']
+                     .number)
+STREAM_FIELD = ReqDetections.DESCRIPTOR.fields_by_name['stream'].number
+MOTION_FIELD = ReqDetections.DESCRIPTOR.fields_by_name['motion'].number
+
+
+def spawn() -> [Process]:
+    """
+    Start the broker and all of its worker processes, returning the process
+    handles.  The processes are daemons so that they are torn down with the
+    parent.
+    """
+    workers = Config.Instance.server.workers
+    affinity = worker_affinity(workers)
+
+    handles = [Process(target=main)]
+    for cores in affinity:
+        handles.append(Process(target=worker_main,
+                               args=(cores, workers.threads)))
+
+    for handle in handles:
+        handle.daemon = True
+        handle.start()
+
+    return handles
+
+
+def worker_affinity(workers: Config) -> [[int]]:
+    """
+    Compute the core set for every worker.  Explicitly configured core sets
+    are used verbatim, otherwise the available cores are dealt out in blocks
+    of `workers.threads`.
+    """
+    if workers.affinity:
+        return [list(cores) for cores in workers.affinity]
+
+    cores = sorted(os.sched_getaffinity(0))
+    threads = max(1, workers.threads)
+    count = workers.count or max(1, len(cores) // threads)
+
+    affinity = []
+    for index in range(count):
+        block = [cores[(index * threads + k) % len(cores)]
+                 for k in range(threads)]
+        affinity.append(sorted(set(block)))
+
+    return affinity
+
+
+def main():
+    """
+    Broker loop.  Workers announce themselves with a `READY` frame, after which
+    they are eligible for dispatch.
+    """
+    ctx = zmq.Context()
+    frontend = ctx.socket(zmq.ROUTER)
+    frontend.bind('tcp://*:{}'.format(Config.Instance.networking.port))
+
+    backend = ctx.socket(zmq.ROUTER)
+    backend.bind(Config.Instance.server.workers.uri)
+
+    max_outstanding = Config.Instance.server.workers.max_outstanding
+    max_affinities = Config.Instance.server.workers.max_affinities
+
+    # worker identity -> number of requests dispatched but not yet answered.
+    outstanding = {}
+
+    # session or stream -> worker identity holding its tracker or background,
+    # least recently used first.
+    affinities = OrderedDict()
+
+    poller = zmq.Poller()
+    poller.register(backend, zmq.POLLIN)
+    polling_frontend = False
+
+    while True:
+        # Only accept client requests while some worker has spare capacity,
+        # otherwise they remain queued inside ZMQ.
+        available = any(n < max_outstanding for n in outstanding.values())
+        if available != polling_frontend:
+            if available:
+                poller.register(frontend, zmq.POLLIN)
+            else:
+                poller.unregister(frontend)
+            polling_frontend = available
+
+        events = dict(poller.poll())
+
+        if backend in events:
+            # Frames are not copied, payloads are passed straight through.
+            (worker, *message) = backend.recv_multipart(copy=False)
+            worker = worker.bytes
+            if len(message) == 1 and message[0].bytes == READY:
+                outstanding[worker] = 0
+            else:
+                outstanding[worker] -= 1
+                frontend.send_multipart(message, copy=False)
+
+        if frontend in events and available:
+            # Load aware dispatch; the least loaded worker takes the request,
+            # unless it belongs to a session or stream.
+            worker = min(outstanding, key=outstanding.get)
+            message = frontend.recv_multipart(copy=False)
+
+            (key, close) = affinity_of(message)
+            if key is not None:
+                worker = affinities.pop(key, worker)
+                if not close:
+                    affinities[key] = worker
+                    while len(affinities) > max_affinities:
+                        affinities.popitem(last=False)
+
+            outstanding[worker] += 1
+            backend.send_multipart([worker] + message, copy=False)
+
+
+def affinity_of(message: list) -> (tuple, bool):
+    """
+    The tracking session, as ('session', session), or motion gated stream, as
+    ('stream', stream), named by the client `message`, if any, and whether
+    the request closes it.
+    """
+    (_, body) = split_envelope(message)
+    tag = bytes(body[0].buffer[:1])
+    if tag not in SESSION_TAGS:
+        return (detection_stream(body[0].buffer), False)
+
+    req = Request()
+    try:
+        req.ParseFromString(body[0].bytes)
+    except Exception:
+        # Left for the worker to report.
+        return (None, False)
+
+    if req.HasField('statistics') and req.statistics.HasField('stream'):
+        return (('stream', req.statistics.stream), False)
+    if req.HasField('tracking') and req.tracking.HasField('session'):
+        return (('session', req.tracking.session), False)
+    if req.HasField('session'):
+        return (('session', req.session.session), req.session.close)
+
+    return (None, False)
+
+
+def detection_stream(data: memoryview) -> tuple:
+    """
+    The stream of the serialized detection `Request` (single or batched) in
+    `data`, as ('stream', stream), if it is motion gated or change gating is
+    enabled.  The images are skipped over rather than parsed or copied.
+    """
+    try:
+        for (number, value) in wire_fields(data):
+            if number not in DETECTIONS_FIELDS \
+                    or not isinstance(value, memoryview):
+                continue
+
+            options = dict(wire_fields(value))
+            stream = options.get(STREAM_FIELD)
+            if isinstance(stream, memoryview) \
+                    and (options.get(MOTION_FIELD)
+                         or Config.Instance.server.gating.enabled):
+                return ('stream', bytes(stream).decode())
+    except (IndexError, ValueError):
+        # Malformed; left for the worker to report.
+        pass
+
+    return None
+
+
+def wire_fields(data: memoryview):
+    """
+    Yield the (number, value) of the fields of a serialized protobuf message;
+    varints as int, length delimited fields as a memoryview of their bytes.
+    """
+    data = memoryview(data).cast('B')
+    offset = 0
+    while offset < len(data):
+        (key, offset) = wire_varint(data, offset)
+        (number, wire_type) = (key >> 3, key & 7)
+        if wire_type == 0:
+            (value, offset) = wire_varint(data, offset)
+        elif wire_type == 2:
+            (length, offset) = wire_varint(data, offset)
+            if offset + length > len(data):
+                raise ValueError('Truncated field {}'.format(number))
+            value = data[offset:offset + length]
+            offset += length
+        elif wire_type in (1, 5):
+            size = 8 if wire_type == 1 else 4
+            value = data[offset:offset + size]
+            offset += size
+        else:
+            raise ValueError('Unsupported wire type {}'.format(wire_type))
+
+        yield (number, value)
+
+
+def wire_varint(data: memoryview, offset: int) -> (int, int):
+    """
+    The varint at `offset`, and the offset following it.
+    """
+    (value, shift) = (0, 0)
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (value, offset)
+        shift += 7
+
+
+def worker_main(cores: [int], threads: int):
+    """
+    Worker process entry point.  Pins the process to `cores`, restricts the
+    inference backend to `threads`, and then serves requests forwarded by the
+    broker exactly as the single process server would.
+    """
+    os.sched_setaffinity(0, cores)
+
+    detector = FlyCentroidDetector(threads)
+
+    ctx = zmq.Context()
+    socket = ctx.socket(zmq.DEALER)
+    socket.connect(Config.Instance.server.workers.uri)
+    socket.send(READY)
+
+    serve(socket, detector)
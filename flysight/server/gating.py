@@ -0,0 +1,117 @@
+"""
+Temporal change gating; a frame which barely differs from the last frame
+evaluated for its stream reuses that frame's heatmap and peaks.
+
+Frames are compared by their signature, the frame shrunk to `dim` squared
+cells of mean gray level.  A fly moving changes the cells it crosses by far
+more than sensor noise does, so the largest change of any cell is compared
+with `threshold`.  Every `refresh` frames the frame is evaluated regardless.
+"""
+from collections import OrderedDict
+import cv2
+import numpy as np
+from flysight.config import Config
+
+
+class FrameGate:
+    """
+    :class FrameGate:
+
+    The last frame evaluated for one stream; its signature, the key of the
+    request options it was evaluated with, and its result.
+    """
+    def __init__(self):
+        self.signature = None
+        self.key = None
+        self.result = None
+
+        # Frames reusing `result` since it was computed.
+        self.age = 0
+
+
+class GateStore:
+    """
+    :class GateStore:
+
+    Frame gates keyed by stream, least recently used first, with counts of the
+    frames skipped and computed.  At most `max_streams` gates are kept.
+    """
+    def __init__(self):
+        config = Config.Instance.server.gating
+        self.dim = config.dim
+        self.threshold = config.threshold
+        self.refresh = config.refresh
+        self.max_streams = config.max_streams
+        self.gates = OrderedDict()
+
+        # {
+        # Totals over all of the streams, and per stream.
+        self.skipped = 0
+        self.computed = 0
+        self.counts = {}
+        # }
+
+    def get(self, stream: str) -> FrameGate:
+        gate = self.gates.pop(stream, None)
+        if gate is None:
+            gate = FrameGate()
+
+        self.gates[stream] = gate
+        while len(self.gates) > self.max_streams:
+            (evicted, _) = self.gates.popitem(last=False)
+            self.counts.pop(evicted, None)
+
+        return gate
+
+    def signature(self, img: np.array) -> np.array:
+        return cv2.resize(img, (self.dim, self.dim),
+                          interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def lookup(self, stream: str, img: np.array,
+               key: tuple) -> (object, np.array):
+        """
+        The result of the last frame evaluated for `stream` with the options
+        `key`, if `img` is close enough to it, otherwise None; and the
+        signature of `img`, for `store`.
+        """
+        gate = self.get(stream)
+        signature = self.signature(img)
+
+        if gate.result is not None \
+                and gate.key == key \
+                and gate.age + 1 < self.refresh \
+                and gate.signature.shape == signature.shape \
+                and np.abs(signature - gate.signature).max() <= self.threshold:
+            gate.age += 1
+            self.count(stream, skipped=True)
+            return (gate.result, signature)
+
+        return (None, signature)
+
+    def store(self, stream: str, signature: np.array, key: tuple, result):
+        """
+        Record the `result` of a frame just evaluated for `stream`.
+        """
+        gate = self.get(stream)
+        gate.signature = signature
+        gate.key = key
+        gate.result = result
+        gate.age = 0
+        self.count(stream, skipped=False)
+
+    def count(self, stream: str, skipped: bool):
+        (stream_skipped, stream_computed) = self.counts.get(stream, (0, 0))
+        if skipped:
+            self.skipped += 1
+            self.counts[stream] = (stream_skipped + 1, stream_computed)
+        else:
+            self.computed += 1
+            self.counts[stream] = (stream_skipped, stream_computed + 1)
+
+    def statistics(self, stream: str = None) -> (int, int):
+        """
+        The (skipped, computed) frame counts of `stream`, or of all streams.
+        """
+        if stream is None:
+            return (self.skipped, self.computed)
+        return self.counts.get(stream, (0, 0))
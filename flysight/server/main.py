@@ -1,17 +1,30 @@
 """
 This file is responsible for implementing a server side `main` function.
 """
+import time
 import numpy as np
-import tensorflow as tf
 import zmq
+from flysight.codec import decode_heatmap, decode_image, encode_heatmap
 from flysight.config import Config
 from flysight.message_pb2 import (
         Request,
+        ReqTracking,
         RepTracking,
+        ReqSession,
+        RepSession,
         ReqDetections,
         RepDetections,
+        ReqDetectionsBatch,
+        RepDetectionsBatch,
+        ReqStatistics,
+        RepStatistics,
         )
+from flysight.server.gating import GateStore
+from flysight.server.regions import MotionStore, Region, clip, intersect, merge
+from flysight.server.session import SessionStore
 from flysight.server.solver import FlyCentroidDetector
+from flysight.server.tracker import FlyCentroidTracker
+from flysight.shared_ring import SharedRing, SharedSlot
 
 
 def main():
@@ -20,36 +33,157 @@ def main():
     # Configure a default detector.
     detector = FlyCentroidDetector()
 
-    # Configure the socket responsible for replying.
+    # Configure the socket responsible for replying.  A ROUTER socket is used
+    # (rather than a REP) so that several requests can be outstanding at once,
+    # which is what allows them to be batched.  REQ clients are unaffected.
+    # DEALER clients (see `AsyncClient`) may pipeline requests; each carries
+    # a correlation frame ahead of the delimiter, which is part of the
+    # envelope and so returned with its reply.
     ctx = zmq.Context()
-    socket = ctx.socket(zmq.REP)
+    socket = ctx.socket(zmq.ROUTER)
     socket.bind('tcp://*:{}'.format(Config.Instance.networking.port))
 
+    serve(socket, detector)
+
+
+def serve(socket: zmq.Socket, detector: FlyCentroidDetector):
+    """
+    Request loop.  Each iteration collects a batch of concurrent requests,
+    evaluates all of the detection requests with a single prediction, and fans
+    the replies back out to each requester.
+    """
+    batching = Config.Instance.server.batching
+    sessions = SessionStore()
+    motions = MotionStore()
+    gates = GateStore() if Config.Instance.server.gating.enabled else None
+
     while True:
-        message = socket.recv()
-
-        # Try and receive the request.  If the request is malformed, send back
-        # an error string.
-        try:
-            req = Request()
-            req.ParseFromString(message)
-        except Exception as err:
-            print('Error: %s' % err)
-            socket.send(b'ERROR: %s' % err)
-            continue
+        messages = receive_batch(socket,
+                                 batching.max_batch_size,
+                                 batching.max_wait_ms)
+
+        detections = []
+        for message in messages:
+            (envelope, body) = split_envelope(message)
+
+            # Try and receive the request.  If the request is malformed, send
+            # back an error string.  Any frames after the message carry pixel
+            # data and are left in place.
+            try:
+                req = Request()
+                req.ParseFromString(body[0].bytes)
+            except Exception as err:
+                print('Error: %s' % err)
+                socket.send_multipart(
+                        envelope + [b'ERROR: %s' % str(err).encode()])
+                continue
+
+            # There are five types of requests within a union; detections
+            # (single or batched), tracking, session and statistics.  This
+            # handles that switch logic.
+            # Detections are deferred so that they can be evaluated together.
+            if   req.HasField('detections') \
+                    or req.HasField('detections_batch'):
+                batch = req.HasField('detections_batch')
+                reqs = expand_batch(req.detections_batch) if batch \
+                        else [req.detections]
+
+                # Reject images which cannot be decoded now, rather than
+                # failing the whole batch they would be evaluated in.
+                try:
+                    check_images(reqs, body[1:])
+                except (ValueError, IndexError, OSError) as err:
+                    socket.send_multipart(
+                            envelope + [b'ERROR: %s' % str(err).encode()])
+                    continue
+
+                detections.append((envelope, reqs, body[1:], batch))
+            elif req.HasField('tracking'):
+                try:
+                    rep = handle_tracking(req.tracking, detector, body[1:],
+                                          sessions)
+                except (ValueError, IndexError, OSError) as err:
+                    socket.send_multipart(
+                            envelope + [b'ERROR: %s' % str(err).encode()])
+                    continue
+
+                socket.send_multipart(envelope + [rep.SerializeToString()])
+            elif req.HasField('session'):
+                try:
+                    rep = handle_session(req.session, sessions)
+                except ValueError as err:
+                    socket.send_multipart(
+                            envelope + [b'ERROR: %s' % str(err).encode()])
+                    continue
 
-        # There are two types of requests within a union; detections, tracking.
-        # This handles that switch logic.
-        if   req.HasField('detections'):
-            rep = handle_detection(req.detections, detector)
-        elif req.HasField('tracking'):
-            rep = handle_tracking(req.tracking)
-        else:
-            rep.send(b'ERROR: Incomprehensible request.')
+                socket.send_multipart(envelope + [rep.SerializeToString()])
+            elif req.HasField('statistics'):
+                rep = handle_statistics(req.statistics, gates)
+                socket.send_multipart(envelope + [rep.SerializeToString()])
+            else:
+                socket.send_multipart(
+                        envelope + [b'ERROR: Incomprehensible request.'])
+
+        if not detections:
             continue
 
         # Done.
-        socket.send(rep.SerializeToString())
+        reps = handle_detections(
+                [req for (_, reqs, _, _) in detections for req in reqs],
+                detector,
+                [frames for (_, reqs, frames, _) in detections for _ in reqs],
+                motions,
+                gates)
+
+        start = 0
+        for (envelope, reqs, _, batch) in detections:
+            group = reps[start:start + len(reqs)]
+            start += len(reqs)
+
+            (rep, frames) = package_batch(group) if batch else group[0]
+            socket.send_multipart(
+                    envelope + [rep.SerializeToString()] + frames, copy=False)
+
+
+def receive_batch(
+        socket: zmq.Socket, max_size: int, max_wait_ms: float) -> [list]:
+    """
+    Block until one multipart message arrives, then keep collecting messages
+    until either `max_size` are held or `max_wait_ms` has elapsed since the
+    first one arrived.
+
+    Messages are received without copying; each part is a `zmq.Frame`.
+    """
+    messages = [socket.recv_multipart(copy=False)]
+    deadline = time.monotonic() + max_wait_ms / 1000.
+
+    while len(messages) < max_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not socket.poll(remaining * 1000., zmq.POLLIN):
+            break
+
+        messages.append(socket.recv_multipart(copy=False))
+
+    return messages
+
+
+def split_envelope(message: list) -> (list, list):
+    """
+    Split a ROUTER multipart `message` into its routing envelope (including
+    the empty delimiter frame) and its body.
+    """
+    delimiter = [len(frame) for frame in message].index(0)
+    return (message[:delimiter + 1], message[delimiter + 1:])
+
+
+def check_images(reqs: [ReqDetections], frames: list):
+    """
+    Decode the image of every request, raising if any of them does not match
+    the data attached to it; a missing frame or shared memory block, or a
+    shared slot out of range.
+    """
+    for req in reqs:
+        decode_image(req.image, frames)
 
 
 def handle_detection(
@@ -58,43 +192,253 @@ def handle_detection(
     Given an input protobuf detection request; apply the detector, package
     a protobuf response, and return.
     """
-    rep = RepDetections()
+    return handle_detections([req], detector)[0][0]
+
+
+def expand_batch(req: ReqDetectionsBatch) -> [ReqDetections]:
+    """
+    One `ReqDetections` per image of the batch, with the options of the batch.
+    """
+    reqs = []
+    for image in req.images:
+        detect = ReqDetections()
+        detect.image.CopyFrom(image)
+        detect.return_heatmap = req.return_heatmap
+        detect.upsample_heatmap = req.upsample_heatmap
+        detect.return_peaks = req.return_peaks
+        detect.heatmap_encoding = req.heatmap_encoding
+        detect.regions.extend(req.regions)
+        if req.HasField('stream'):
+            detect.stream = req.stream
+        detect.motion = req.motion
+        reqs.append(detect)
+
+    return reqs
+
+
+def package_batch(reps: [(RepDetections, list)]) -> (RepDetectionsBatch,
+                                                      list):
+    """
+    Inverse of `expand_batch` for the replies, renumbering their frames.
+    """
+    batch = RepDetectionsBatch()
+    frames = []
+    for (rep, buffers) in reps:
+        if rep.heatmap.HasField('frame'):
+            rep.heatmap.frame += len(frames)
+        frames += buffers
+        batch.detections.add().CopyFrom(rep)
+
+    return (batch, frames)
+
+
+def handle_detections(
+        reqs: [ReqDetections],
+        detector: FlyCentroidDetector,
+        frames: [list] = None,
+        motions: MotionStore = None,
+        gates: GateStore = None) -> [(RepDetections, list)]:
+    """
+    Batched form of `handle_detection`.  All of the images are evaluated in a
+    single prediction and a response is returned for every request, in order.
+
+    `frames` holds, per request, the ZMQ frames which followed its message.
+    Each response is paired with the list of frames to send after it; a reply
+    uses frames if and only if its request did.  A request made through a
+    shared memory slot has its heatmap written into the same slot.
+
+    Requests for motion gating are only honoured given the `motions` of the
+    streams.  Given `gates`, a request naming a stream whose image barely
+    changed reuses the heatmap and peaks of the stream's last evaluated image.
+    """
+    frames = frames or [[] for _ in reqs]
 
     # The third dimension here is necessary to support the tensor interface.
-    image = np.frombuffer(req.image.data, dtype=np.uint8).reshape(
-                            req.image.rows,
-                            req.image.cols,
-                            1)
-
-    # Always perform the heatmap computation.
-    heatmap = detector.generate_heatmap(image, req.upsample_heatmap)
-
-    # Do peak detection.
-    if req.return_peaks:
-        peaks = detector.find_peaks(heatmap)
-        for peak in peaks:
-            rpeak = rep.peaks.add()
-            rpeak.row = peak[1]
-            rpeak.col = peak[0]
-
-    # If the requester wants the heatmap returned, package it.
-    if req.return_heatmap:
-        hm = tf.squeeze(heatmap)
-        rep.heatmap.rows = hm.shape[1]
-        rep.heatmap.cols = hm.shape[0]
-        rep.heatmap.data = hm.numpy().tobytes()
+    images = [decode_image(req.image, buffers)[:, :, np.newaxis]
+              for (req, buffers) in zip(reqs, frames)]
 
-    return rep
+    # (heatmap, peaks, regions) per request.
+    results = [None] * len(reqs)
+    signatures = [None] * len(reqs)
+    if gates is not None:
+        for (index, (req, image)) in enumerate(zip(reqs, images)):
+            if req.HasField('stream'):
+                (results[index], signatures[index]) = \
+                        gates.lookup(req.stream, image, gate_key(req, image))
+
+    pending = [index for (index, result) in enumerate(results)
+               if result is None]
+    regions = [request_regions(reqs[index], images[index], motions)
+               for index in pending]
+
+    # Perform the heatmap computation of the images which need it.
+    heatmaps = detector.generate_heatmaps(
+                    [images[index] for index in pending],
+                    [reqs[index].upsample_heatmap for index in pending],
+                    regions)
+
+    for (index, heatmap, region) in zip(pending, heatmaps, regions):
+        req = reqs[index]
+
+        # Restore the batch dimension.
+        heatmap = heatmap[np.newaxis]
+
+        # Do peak detection.
+        peaks = detector.find_peaks(heatmap) if req.return_peaks else None
+
+        results[index] = (heatmap, peaks, region)
+        if signatures[index] is not None:
+            gates.store(req.stream,
+                        signatures[index],
+                        gate_key(req, images[index]),
+                        results[index])
+
+    reps = []
+    for (req, (heatmap, peaks, region)) in zip(reqs, results):
+        rep = RepDetections()
+        for (row, col, rows, cols) in region or []:
+            rroi = rep.regions.add()
+            (rroi.row, rroi.col, rroi.rows, rroi.cols) = (row, col, rows, cols)
+
+        # Mirror the transport of the request.  Shared memory falls back to
+        # frames should the heatmap not fit the slot.
+        buffers = None
+        shared = None
+        if req.image.HasField('shared_memory'):
+            shared = SharedSlot(SharedRing.Attach(req.image.shared_memory),
+                                req.image.slot)
+            buffers = []
+        elif req.image.HasField('frame'):
+            buffers = []
+
+        if req.return_peaks:
+            for peak in peaks:
+                rpeak = rep.peaks.add()
+                rpeak.row = peak[1]
+                rpeak.col = peak[0]
+
+        # If the requester wants the heatmap returned, package it.
+        if req.return_heatmap:
+            encode_heatmap(heatmap[0, :, :, 0],
+                           req.heatmap_encoding,
+                           rep.heatmap,
+                           buffers,
+                           shared)
+
+        reps.append((rep, buffers or []))
+
+    return reps
+
+
+def gate_key(req: ReqDetections, image: np.array) -> tuple:
+    """
+    The options of `req` which its result depends on, besides its image.
+    """
+    return (image.shape,
+            req.upsample_heatmap,
+            req.return_peaks,
+            req.motion,
+            tuple((roi.row, roi.col, roi.rows, roi.cols)
+                  for roi in req.regions))
+
+
+def request_regions(
+        req: ReqDetections, image: np.array, motions: MotionStore) -> [Region]:
+    """
+    The regions of `image` to evaluate for `req`, None for all of it.  The
+    requested regions are clipped to the image, and with motion gating only
+    the moving parts of them are kept.
+    """
+    (rows, cols) = image.shape[:2]
+
+    regions = None
+    if req.regions:
+        regions = [clip(Region(roi.row, roi.col, roi.rows, roi.cols),
+                        rows,
+                        cols) for roi in req.regions]
+        regions = merge([region for region in regions if region is not None])
+
+    if req.motion and motions is not None:
+        moving = motions.get(req.stream).regions(image)
+        if regions is not None:
+            moving = [intersect(lhs, rhs) for lhs in moving for rhs in regions]
+            moving = merge([region for region in moving if region is not None])
+        regions = moving
 
-def handle_tracking(req):
+    return regions
+
+
+def handle_tracking(
+        req: ReqTracking,
+        detector: FlyCentroidDetector,
+        frames: list = None,
+        sessions: SessionStore = None) -> RepTracking:
     """
-    :notimplemented:
+    Advance the tracker held in the request context, or in `sessions` for a
+    session request, by one frame and package the confirmed tracks with the
+    new context.  Without peaks in the request they are found in its heatmap.
     """
-    if not req.has_context():
-        tracker = FlyCentroidDetector()
+    if req.HasField('session'):
+        tracker = sessions.get(req.session)
+    elif req.HasField('context'):
+        tracker = FlyCentroidTracker.Load(req.context)
+    else:
+        tracker = FlyCentroidTracker()
+
+    if req.peaks or not req.HasField('heatmap'):
+        peaks = np.array([(peak.row, peak.col) for peak in req.peaks])
     else:
-        tracker = FlyCentroidDetector.Load(req.context())
+        heatmap = decode_heatmap(req.heatmap, frames)
+
+        # Match the coordinates of `handle_detections`.
+        peaks = detector.find_peaks(heatmap)[:, ::-1]
+
+    tracks = tracker.update(peaks)
+
+    rep = RepTracking()
+    if not req.HasField('session'):
+        rep.context = tracker.dump()
+    for track in tracks:
+        rtrack = rep.tracks.add()
+        rtrack.track_id = int(track['track_id'])
+        rtrack.coordinate.row = track['row']
+        rtrack.coordinate.col = track['col']
+
+    return rep
+
+
+def handle_session(req: ReqSession, sessions: SessionStore) -> RepSession:
+    """
+    Restore, snapshot and/or close a tracking session, in that order.
+    """
+    if req.HasField('restore'):
+        sessions.restore(req.session, req.restore)
+
+    rep = RepSession()
+    if req.snapshot:
+        context = sessions.snapshot(req.session)
+        if context is not None:
+            rep.context = context
+
+    if req.close:
+        sessions.close(req.session)
+
+    return rep
+
+
+def handle_statistics(req: ReqStatistics, gates: GateStore) -> RepStatistics:
+    """
+    The frames skipped and computed by change gating (see `GateStore`), for
+    the stream of the request or for all of them.  Zero without gating.
+    """
+    rep = RepStatistics()
+    (rep.skipped, rep.computed) = (0, 0)
+    if gates is not None:
+        (rep.skipped, rep.computed) = gates.statistics(
+                req.stream if req.HasField('stream') else None)
+
+    return rep
 
 
 if __name__ == '__main__':
-    main(8003, '/tmp/', FlyCentroidDetector.DEFAULT_MODEL_URL)
+    main()
@@ -0,0 +1,194 @@
+"""
+Peak (centroid) finders operating on a single heatmap.
+
+Both implementations return a float64 array of shape [N, 2] holding the (row,
+col) of every peak, normalized by the heatmap dimensions.
+"""
+import cv2
+import numpy as np
+
+# Beyond this many peak pixels, or tied pairs of them, `plateaus` labels a mask
+# rather than merging pairs one by one.
+MAX_SPARSE_PEAKS = 1024
+
+
+def find_peaks(
+        heatmap: np.array,
+        dim: int,
+        threshold: float,
+        top_k: int = 0,
+        subpixel: bool = True) -> np.array:
+    """
+    Vectorized non-max suppression.
+
+    A pixel is a peak if it equals the maximum of its `dim` x `dim`
+    neighbourhood and exceeds `threshold` times the global maximum.  Connected
+    peak pixels (plateaus) are merged into a single peak at their centroid.
+    With `subpixel` each single pixel peak is refined to the weighted centroid
+    of its 3x3 neighbourhood; a plateau's centroid already is subpixel.  A
+    non-zero `top_k` keeps only the strongest peaks, ordered by strength.
+    """
+    heatmap = np.ascontiguousarray(np.squeeze(heatmap), dtype=np.float32)
+    (rows, cols) = heatmap.shape
+
+    # Max filter; `dilate` pads the border with -inf.
+    pooled = cv2.dilate(heatmap, np.ones((dim, dim), dtype=np.uint8))
+
+    # Thresholding first leaves only a few pixels to compare against the
+    # filtered maximum.
+    flat = heatmap.reshape(-1)
+    index = np.flatnonzero(flat > threshold * flat.max())
+    index = index[flat[index] == pooled.reshape(-1)[index]]
+    if not len(index):
+        return np.empty((0, 2), dtype=np.float64)
+
+    # Merge plateaus into their centroid.
+    (labels, count) = plateaus(index, cols)
+    size = np.bincount(labels, minlength=count)
+    peaks = np.stack([np.bincount(labels, index // cols, count) / size,
+                      np.bincount(labels, index % cols, count) / size], axis=1)
+
+    index = np.rint(peaks).astype(np.intp)
+    strength = heatmap[index[:, 0], index[:, 1]]
+
+    if top_k and len(peaks) > top_k:
+        keep = np.argpartition(-strength, top_k)[:top_k]
+        keep = keep[np.argsort(-strength[keep])]
+        peaks = peaks[keep]
+        index = index[keep]
+        size = size[keep]
+
+    if subpixel:
+        peaks = np.where((size > 1)[:, np.newaxis], peaks,
+                         refine(heatmap, index))
+
+    return peaks / np.array([rows, cols], dtype=np.float64)
+
+
+def plateaus(index: np.array, cols: int) -> (np.array, int):
+    """
+    Given the sorted flat `index` of the peak pixels in an image `cols` wide,
+    label them such that 8-connected pixels share a label.  Returns the labels
+    and their count.
+
+    Ties are rare, so the few connected pairs are merged with a plain
+    union-find.  Saturated heatmaps can tie over large areas though, and those
+    are labelled as the connected components of a mask instead.
+    """
+    if len(index) > MAX_SPARSE_PEAKS:
+        return components(index, cols)
+
+    col = index % cols
+    pairs = []
+
+    # Neighbours which precede a pixel in raster order; left, and the three
+    # above.  `dcol` guards against wrapping around a row.
+    for (offset, dcol) in ((1, 1), (cols - 1, -1), (cols, 0), (cols + 1, 1)):
+        neighbour = index - offset
+        position = np.minimum(np.searchsorted(index, neighbour),
+                              len(index) - 1)
+        connected = (index[position] == neighbour) \
+                  & (col - dcol >= 0) & (col - dcol < cols)
+        pairs.append((np.flatnonzero(connected), position[connected]))
+
+    count = sum(len(lhs) for (lhs, _) in pairs)
+    if not count:
+        return (np.arange(len(index)), len(index))
+    if count > MAX_SPARSE_PEAKS:
+        return components(index, cols)
+
+    parent = np.arange(len(index))
+    for (lhs, rhs) in pairs:
+        for (i, j) in zip(lhs, rhs):
+            i = root(parent, i)
+            j = root(parent, j)
+            parent[max(i, j)] = min(i, j)
+
+    roots = np.array([root(parent, i) for i in range(len(index))])
+    (_, labels) = np.unique(roots, return_inverse=True)
+    return (labels, labels.max() + 1)
+
+
+def components(index: np.array, cols: int) -> (np.array, int):
+    """
+    `plateaus` through the connected components of a mask of the pixels.
+    """
+    mask = np.zeros((index[-1] // cols + 1, cols), dtype=np.uint8)
+    mask.reshape(-1)[index] = 1
+    (count, labels) = cv2.connectedComponents(mask, connectivity=8,
+                                              ltype=cv2.CV_32S)
+
+    # Label 0 is the background.
+    return (labels.reshape(-1)[index] - 1, count - 1)
+
+
+def root(parent: np.array, i: int) -> int:
+    """
+    Union-find root of `i`, with path halving.
+    """
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def refine(heatmap: np.array, index: np.array) -> np.array:
+    """
+    Weighted centroid of the 3x3 neighbourhood around each integer peak in
+    `index` ([N, 2] of row, col).  Weights are taken relative to the
+    neighbourhood minimum so that the background does not pull the centroid.
+    Pixels beyond the border carry no weight.
+    """
+    offsets = np.arange(-1, 2)
+
+    # [N, 3, 3] windows.
+    rows = index[:, 0, np.newaxis, np.newaxis] + offsets[:, np.newaxis]
+    cols = index[:, 1, np.newaxis, np.newaxis] + offsets[np.newaxis, :]
+    valid = (rows >= 0) & (rows < heatmap.shape[0]) \
+          & (cols >= 0) & (cols < heatmap.shape[1])
+
+    window = heatmap[np.clip(rows, 0, heatmap.shape[0] - 1),
+                     np.clip(cols, 0, heatmap.shape[1] - 1)].astype(np.float64)
+    window = np.where(valid, window, np.inf)
+    window = np.where(valid,
+                      window - window.min(axis=(1, 2), keepdims=True),
+                      0.)
+
+    total = window.sum(axis=(1, 2))
+    total[total == 0] = 1.
+
+    drow = (window.sum(axis=2) * offsets).sum(axis=1) / total
+    dcol = (window.sum(axis=1) * offsets).sum(axis=1) / total
+
+    return index + np.stack([drow, dcol], axis=1)
+
+
+def find_peaks_tensorflow(
+        heatmap: np.array, dim: int, threshold: float) -> np.array:
+    """
+    The original implementation built from eager tensorflow ops.  Every pixel
+    tied with its local maximum is returned, so plateaus yield several peaks.
+    """
+    # Imported here so that the lighter inference backends do not pay for
+    # importing tensorflow.
+    import tensorflow as tf
+
+    # Use max pooling to find the centroid.
+    max_pooled = tf.nn.pool(heatmap, window_shape=(dim, dim),
+                            pooling_type='MAX',
+                            padding='SAME')
+    maxima = tf.where(tf.equal(heatmap, max_pooled), heatmap,
+                      tf.zeros_like(heatmap))
+
+    # Squeeze out the unused dimension
+    maxima = tf.squeeze(maxima)
+
+    # Find global maximum
+    maximum = tf.math.reduce_max(maxima)
+
+    # Find the indices of the local maximums
+    indices = tf.where(maxima > threshold * maximum).numpy(
+                      ).astype(np.float64)
+    indices /= tf.squeeze(heatmap).shape
+
+    return indices
@@ -0,0 +1,164 @@
+"""
+Regions of interest; the parts of a frame which are worth evaluating.
+
+Regions are either requested by the client, or found by a `MotionModel` which
+keeps a running background of a video stream and reports where the frame
+departs from it.  Flies which stop moving fade into the background only
+slowly, as the background is updated far more slowly under the foreground.
+"""
+from collections import OrderedDict, namedtuple
+import cv2
+import numpy as np
+from flysight.config import Config
+
+# A rectangle of a frame, in pixels.
+Region = namedtuple('Region', ['row', 'col', 'rows', 'cols'])
+
+
+def intersect(lhs: Region, rhs: Region) -> Region:
+    """
+    The intersection of two regions, None if they are disjoint.
+    """
+    top = max(lhs.row, rhs.row)
+    left = max(lhs.col, rhs.col)
+    bottom = min(lhs.row + lhs.rows, rhs.row + rhs.rows)
+    right = min(lhs.col + lhs.cols, rhs.col + rhs.cols)
+    if bottom <= top or right <= left:
+        return None
+
+    return Region(top, left, bottom - top, right - left)
+
+
+def clip(region: Region, rows: int, cols: int) -> Region:
+    """
+    The part of `region` inside a `rows` by `cols` frame, None if there is
+    none.
+    """
+    return intersect(region, Region(0, 0, rows, cols))
+
+
+def merge(regions: [Region]) -> [Region]:
+    """
+    Replace the overlapping regions by their bounding boxes until none
+    overlap, so that no pixel is evaluated twice.
+    """
+    regions = list(regions)
+    merged = True
+    while merged:
+        merged = False
+        for (i, lhs) in enumerate(regions):
+            for (j, rhs) in enumerate(regions[i + 1:], i + 1):
+                if intersect(lhs, rhs) is None:
+                    continue
+
+                top = min(lhs.row, rhs.row)
+                left = min(lhs.col, rhs.col)
+                bottom = max(lhs.row + lhs.rows, rhs.row + rhs.rows)
+                right = max(lhs.col + lhs.cols, rhs.col + rhs.cols)
+                regions[i] = Region(top, left, bottom - top, right - left)
+                del regions[j]
+                merged = True
+                break
+
+            if merged:
+                break
+
+    return regions
+
+
+def mask(heatmap: np.array, regions: [Region], rows: int,
+         cols: int) -> np.array:
+    """
+    The [rows', cols', 1] `heatmap` of a `rows` by `cols` frame, zero outside
+    of the `regions` of the frame.
+    """
+    (heat_rows, heat_cols) = heatmap.shape[:2]
+    masked = np.zeros_like(heatmap)
+    for region in regions:
+        top = region.row * heat_rows // rows
+        left = region.col * heat_cols // cols
+        bottom = -(-(region.row + region.rows) * heat_rows // rows)
+        right = -(-(region.col + region.cols) * heat_cols // cols)
+        masked[top:bottom, left:right] = heatmap[top:bottom, left:right]
+
+    return masked
+
+
+class MotionModel:
+    """
+    :class MotionModel:
+
+    The running background of one stream, kept at `scale` of the frame size.
+    """
+    def __init__(self):
+        self.config = Config.Instance.server.motion
+        self.background = None
+
+    def regions(self, img: np.array) -> [Region]:
+        """
+        Update the background with the grayscale `img`, and return the regions
+        which moved, padded by `margin` pixels.  The first frame of a stream
+        (or of a new size) is taken whole.
+        """
+        config = self.config
+        (rows, cols) = img.shape[:2]
+        small = cv2.resize(img,
+                           (max(int(cols * config.scale), 1),
+                            max(int(rows * config.scale), 1)),
+                           interpolation=cv2.INTER_AREA).astype(np.float32)
+
+        if self.background is None or self.background.shape != small.shape:
+            self.background = small
+            return [Region(0, 0, rows, cols)]
+
+        foreground = (cv2.absdiff(small, self.background)
+                      > config.threshold).astype(np.uint8)
+        cv2.accumulateWeighted(small, self.background, config.learning_rate,
+                               mask=1 - foreground)
+        cv2.accumulateWeighted(small, self.background,
+                               config.foreground_learning_rate,
+                               mask=foreground)
+
+        # Pad the moving pixels by the margin, which also joins nearby
+        # blobs into one region.
+        margin = max(int(np.ceil(config.margin * config.scale)), 1)
+        kernel = np.ones((2 * margin + 1, 2 * margin + 1), dtype=np.uint8)
+        foreground = cv2.dilate(foreground, kernel)
+
+        (count, _, stats, _) = cv2.connectedComponentsWithStats(foreground)
+        regions = []
+        for (left, top, width, height, _) in stats[1:count]:
+            region = Region(int(top / config.scale),
+                            int(left / config.scale),
+                            int(np.ceil(height / config.scale)),
+                            int(np.ceil(width / config.scale)))
+            regions.append(clip(region, rows, cols))
+
+        return merge(regions)
+
+
+class MotionStore:
+    """
+    :class MotionStore:
+
+    Motion models keyed by stream, least recently used first.  At most
+    `max_streams` are kept.
+    """
+    def __init__(self):
+        self.max_streams = Config.Instance.server.motion.max_streams
+        self.streams = OrderedDict()
+
+    def get(self, stream: str) -> MotionModel:
+        """
+        The motion model of `stream`, created if necessary.
+        """
+        model = self.streams.pop(stream, None)
+        if model is None:
+            model = MotionModel()
+
+        self.streams[stream] = model
+        while len(self.streams) > self.max_streams:
+            self.streams.popitem(last=False)
+
+        return model
+
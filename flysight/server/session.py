@@ -0,0 +1,82 @@
+"""
+Server side tracking sessions.  Rather than passing the tracker context back
+and forth with every frame, a client names a session and the tracker is kept
+here between its frames.
+"""
+import time
+from collections import OrderedDict
+from flysight.config import Config
+from flysight.server.tracker import FlyCentroidTracker
+
+
+class SessionStore:
+    """
+    :class SessionStore:
+
+    Trackers keyed by session ID, least recently used first.  Sessions idle
+    for longer than `idle_timeout_s` are evicted, as are the least recently
+    used ones while the trackers together hold more than `max_bytes`.  A frame
+    for an unknown (or evicted) session starts a new tracker.
+    """
+    def __init__(self):
+        config = Config.Instance.tracker.sessions
+        self.idle_timeout = config.idle_timeout_s
+        self.max_bytes = config.max_bytes
+
+        # session -> (last access, tracker)
+        self.sessions = OrderedDict()
+
+    def get(self, session: str) -> FlyCentroidTracker:
+        """
+        The tracker of `session`, created if necessary.
+        """
+        if session in self.sessions:
+            (_, tracker) = self.sessions.pop(session)
+        else:
+            tracker = FlyCentroidTracker()
+
+        self.sessions[session] = (time.monotonic(), tracker)
+        self.evict()
+        return tracker
+
+    def restore(self, session: str, context: bytes):
+        """
+        Replace the tracker of `session` with the one in `context`.
+        """
+        self.sessions.pop(session, None)
+        self.sessions[session] = (time.monotonic(),
+                                  FlyCentroidTracker.Load(context))
+        self.evict()
+
+    def snapshot(self, session: str) -> bytes:
+        """
+        The context of the tracker of `session`, None if there is none.
+        """
+        if session not in self.sessions:
+            return None
+
+        (_, tracker) = self.sessions[session]
+        return tracker.dump()
+
+    def close(self, session: str):
+        self.sessions.pop(session, None)
+
+    def nbytes(self) -> int:
+        return sum(tracker.nbytes() for (_, tracker) in self.sessions.values())
+
+    def evict(self):
+        """
+        Drop the idle sessions, then the least recently used ones until the
+        memory cap is met.  The most recently used session is always kept.
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        while self.sessions:
+            (last, _) = next(iter(self.sessions.values()))
+            if last >= deadline:
+                break
+            self.sessions.popitem(last=False)
+
+        total = self.nbytes()
+        while total > self.max_bytes and len(self.sessions) > 1:
+            (_, (_, tracker)) = self.sessions.popitem(last=False)
+            total -= tracker.nbytes()
@@ -1,6 +1,9 @@
 import numpy as np
-import tensorflow as tf
 from flysight.config import Config
+from flysight.server.backend import Backend, fetch_model
+from flysight.server.peaks import find_peaks, find_peaks_tensorflow
+from flysight.server.regions import Region, mask
+from flysight.server.tiling import blend, split, tile_grid
 
 
 class FlyCentroidDetector:
@@ -8,73 +11,160 @@ class FlyCentroidDetector:
     :class FlyCentroidDetector:
 
     This class can be slightly expensive to instantiate and should only be done
-    once.  Wraps the necessary tensorflow logic for extracting information from
-    images and heatmaps.
+    once.  Wraps the inference backend and the logic for extracting information
+    from images and heatmaps.
     """
-    def __init__(self):
-        url   = Config.Instance.model.url
-        cache = Config.Instance.model.cache
-        model_path = tf.keras.utils.get_file(
-                                'model.h5',
-                                url,
-                                extract=False,
-                                cache_subdir=cache)
-        self.__model = tf.keras.models.load_model(model_path, compile=False)
+    def __init__(self, threads: int = None):
+        """
+        `threads` optionally restricts the number of threads the inference
+        backend may use.
+        """
+        model_path = fetch_model(Config.Instance.model.url,
+                                 Config.Instance.model.cache)
+        self.__backend = Backend.Create(Config.Instance.model.backend,
+                                        model_path,
+                                        threads)
+
+        # Peak finding parameters.
+        centroid_detector = Config.Instance.centroid_detector
+        self.__peak_finder = centroid_detector.peak_finder
+        self.__nonmax_suppression_dim = centroid_detector.nonmax_suppression_dim
+        self.__coef_maximum_threshold = centroid_detector.coef_maximum_threshold
+        self.__top_k = centroid_detector.top_k
+        self.__subpixel = centroid_detector.subpixel
+
+        # Tiled inference parameters.
+        self.__tiling = Config.Instance.model.tiling
+
+        # Pay for any lazy initialization (graph tracing, tensor allocation)
+        # up front.
+        self.__backend.warmup()
 
     def generate_heatmap(
             self, img: np.array, upsample_heatmap: bool = False) -> np.array:
         """
-        Given an `img` input use the tensorflow prediction to generate a
-        heatmap.  The heatmap is a float32 matrix.
+        Given an `img` input use the model prediction to generate a
+        heatmap.  The heatmap is a float32 matrix of shape [1, rows, cols, 1].
         """
-        # Convert to grayscale if necessary.
-        if img.shape[-1] != 1:
-            img = img[:, :, :1]
-
-        # Scale to [0, 1]
-        X = np.expand_dims(img, axis=0).astype("float32") / 255.
-
-        # Normalize to fixed dimensions.
-        X = tf.image.resize(X, size=[512, 512])
-
-        # Perform the prediction and return.
-        Y = self.__model.predict(X)
+        return self.generate_heatmaps([img], upsample_heatmap)[0][np.newaxis]
 
-        # If we want to upsample back to original image dimensions.
-        if upsample_heatmap:
-            Y = tf.image.resize(Y, size=img.shape[:2])
-
-        return Y
+    def generate_heatmaps(
+            self, imgs: [np.array], upsample_heatmap=False,
+            regions: [[Region]] = None) -> [np.array]:
+        """
+        Batched form of `generate_heatmap`.  `upsample_heatmap` is either a
+        single flag for all of the images or a list with one flag per image.
+        `regions` optionally holds, per image, None or the regions of the
+        image to evaluate; its heatmap is zero outside of them.
+
+        Images sharing a shape and upsample flag are stacked and evaluated in a
+        single call.  Returns one float32 [rows, cols, 1] heatmap per image, in
+        the order of `imgs`.  An image without any region is not evaluated.
+
+        With `model.tiling` enabled, images larger than a tile are evaluated
+        as tiles instead (see `generate_tiled_heatmaps`), and their heatmaps
+        have the dimensions of the image whatever `upsample_heatmap`.
+        """
+        if isinstance(upsample_heatmap, bool):
+            upsample_heatmap = [upsample_heatmap] * len(imgs)
+        if regions is None:
+            regions = [None] * len(imgs)
+
+        # Group the images by their shape and upsample flag.
+        heatmaps = [None] * len(imgs)
+        groups = {}
+        tiled = []
+        for (index, (img, upsample)) in enumerate(zip(imgs, upsample_heatmap)):
+            # Convert to grayscale if necessary.
+            if img.ndim == 2:
+                img = img[:, :, np.newaxis]
+            elif img.shape[-1] != 1:
+                img = img[:, :, :1]
+
+            tiling = self.__tiling
+            if tiling.enabled and max(img.shape[:2]) > tiling.size:
+                tiled.append((index, img))
+            elif regions[index] is not None and not regions[index]:
+                dim = img.shape[:2] if upsample else self.__backend.INPUT_DIM
+                heatmaps[index] = np.zeros(tuple(dim) + (1, ), np.float32)
+            else:
+                key = (img.shape, upsample)
+                groups.setdefault(key, []).append((index, img))
+
+        # Perform the predictions and return.
+        if tiled:
+            Y = self.generate_tiled_heatmaps(
+                    [img for (_, img) in tiled],
+                    [regions[index] for (index, _) in tiled])
+            for ((index, _), heatmap) in zip(tiled, Y):
+                heatmaps[index] = heatmap
+
+        for ((_, upsample), members) in groups.items():
+            X = np.stack([img for (_, img) in members])
+            Y = self.__backend.infer(X, upsample)
+
+            for ((index, img), heatmap) in zip(members, Y):
+                if regions[index] is not None:
+                    heatmap = mask(heatmap, regions[index], *img.shape[:2])
+                heatmaps[index] = heatmap
+
+        return heatmaps
+
+    def generate_tiled_heatmaps(
+            self, imgs: [np.array], regions: [[Region]] = None) -> [np.array]:
+        """
+        Evaluate [rows, cols, 1] images at full resolution, as overlapping
+        `model.tiling.size` squared tiles blended into one float32 [rows, cols,
+        1] heatmap per image.  The tiles of all of the images are evaluated
+        together, at most `model.tiling.max_batch` per call.  With `regions`
+        (per image, None or a list) only the tiles overlapping them are.
+        """
+        size = self.__tiling.size
+        overlap = self.__tiling.overlap
+        max_batch = self.__tiling.max_batch
+        if regions is None:
+            regions = [None] * len(imgs)
+
+        grids = [tile_grid(img.shape[0], img.shape[1], size, overlap, region)
+                 for (img, region) in zip(imgs, regions)]
+        X = np.concatenate([split(img, grid, size)
+                            for (img, grid) in zip(imgs, grids)])
+
+        # Upsampling returns the tile heatmaps at the tile size, whatever the
+        # model input size.
+        Y = [self.__backend.infer(X[start:start + max_batch], True)
+             for start in range(0, len(X), max_batch)]
+        Y = np.concatenate(Y) if Y else X.astype(np.float32)
+
+        heatmaps = []
+        start = 0
+        for (img, grid, region) in zip(imgs, grids, regions):
+            heatmap = blend(Y[start:start + len(grid)],
+                            grid,
+                            img.shape[0],
+                            img.shape[1],
+                            size,
+                            overlap)
+            if region is not None:
+                heatmap = mask(heatmap, region, *img.shape[:2])
+
+            heatmaps.append(heatmap)
+            start += len(grid)
+
+        return heatmaps
 
     def find_peaks(self, heatmap: np.array) -> np.array:
         """
         Given an input `heatmap`, use non-max suppression to detect the peaks.
+        Returns the [N, 2] (row, col) peaks normalized by the heatmap shape.
         """
-        # Use max pooling to find the centroid.
-        dim = (Config.Instance.centroid_detector.nonmax_suppression_dim,
-               Config.Instance.centroid_detector.nonmax_suppression_dim)
-        max_pooled = tf.nn.pool(heatmap, window_shape=dim,
-                                pooling_type='MAX',
-                                padding='SAME')
-        maxima = tf.where(tf.equal(heatmap, max_pooled), heatmap,
-                          tf.zeros_like(heatmap))
-
-        # Squeeze out the unused dimension
-        maxima = tf.squeeze(maxima)
-
-        # Find global maximum
-        maximum = tf.math.reduce_max(maxima)
-
-        # Find the indices of the local maximums
-        threshold = Config.Instance.centroid_detector.coef_maximum_threshold
-        indices = tf.where(maxima > threshold * maximum).numpy(
-                          ).astype(np.float64)
-        indices /= tf.squeeze(heatmap).shape
-
-        # Tensorflow column/row conventions are opposite of what is desired
-        # for this application.
-        #indices[:,[0, 1]] = indices[:,[1, 0]]
-
-        return indices
-
-
+        if self.__peak_finder == 'tensorflow':
+            return find_peaks_tensorflow(heatmap,
+                                         self.__nonmax_suppression_dim,
+                                         self.__coef_maximum_threshold)
+
+        return find_peaks(heatmap,
+                          self.__nonmax_suppression_dim,
+                          self.__coef_maximum_threshold,
+                          self.__top_k,
+                          self.__subpixel)
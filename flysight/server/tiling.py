@@ -0,0 +1,88 @@
+"""
+Tiled inference; a frame larger than the model input is evaluated at its full
+resolution as overlapping tiles, rather than being squashed to the model input.
+
+The tile heatmaps are blended back into a heatmap of the frame's dimensions.
+Every tile is weighted by a ramp which falls off over the overlap towards its
+edges, so that the seams between tiles, where the model sees the least
+context, contribute the least.
+"""
+import numpy as np
+from flysight.server.regions import Region
+
+
+def tile_starts(dim: int, size: int, overlap: int) -> [int]:
+    """
+    The offsets of the tiles along an axis of length `dim`, overlapping by at
+    least `overlap` and spread evenly from one end to the other.
+    """
+    if dim <= size:
+        return [0]
+
+    count = int(np.ceil((dim - overlap) / (size - overlap)))
+    return [int(start)
+            for start in np.rint(np.linspace(0, dim - size, count))]
+
+
+def tile_grid(rows: int, cols: int, size: int, overlap: int,
+              regions: [Region] = None) -> [(int, int)]:
+    """
+    The (top, left) of every tile covering a `rows` by `cols` frame, or only
+    its `regions` if given.
+    """
+    if regions is None:
+        regions = [Region(0, 0, rows, cols)]
+
+    # Tiles are kept inside the frame, where it is larger than a tile.
+    grid = set()
+    for region in regions:
+        for top in tile_starts(region.rows, size, overlap):
+            for left in tile_starts(region.cols, size, overlap):
+                grid.add((min(region.row + top, max(rows - size, 0)),
+                          min(region.col + left, max(cols - size, 0))))
+
+    return sorted(grid)
+
+
+def tile_weights(size: int, overlap: int) -> np.array:
+    """
+    The [size, size] blending weights of a tile.
+    """
+    distance = np.minimum(np.arange(size), np.arange(size)[::-1]) + 0.5
+    ramp = np.clip(distance / max(overlap, 1), 1e-3, 1.).astype(np.float32)
+    return np.outer(ramp, ramp)
+
+
+def split(img: np.array, grid: [(int, int)], size: int) -> np.array:
+    """
+    Cut a [rows, cols, 1] image into the [len(grid), size, size, 1] tiles of
+    `grid`.  Tiles overhanging the image (when it is smaller than a tile) are
+    padded with black.
+    """
+    tiles = np.zeros((len(grid), size, size, 1), dtype=img.dtype)
+    for (tile, (top, left)) in zip(tiles, grid):
+        region = img[top:top + size, left:left + size]
+        tile[:region.shape[0], :region.shape[1]] = region
+
+    return tiles
+
+
+def blend(heatmaps: np.array, grid: [(int, int)], rows: int, cols: int,
+          size: int, overlap: int) -> np.array:
+    """
+    Blend the [len(grid), size, size, 1] heatmaps of the tiles of `grid` into
+    a [rows, cols, 1] heatmap, which is zero where no tile lies.
+    """
+    weights = tile_weights(size, overlap)
+    total = np.zeros((rows, cols), dtype=np.float32)
+    weight = np.zeros((rows, cols), dtype=np.float32)
+
+    for (heatmap, (top, left)) in zip(heatmaps, grid):
+        (height, width) = (min(size, rows - top), min(size, cols - left))
+        total[top:top + height, left:left + width] += \
+                heatmap[:height, :width, 0] * weights[:height, :width]
+        weight[top:top + height, left:left + width] += \
+                weights[:height, :width]
+
+    np.divide(total, weight, out=total, where=weight > 0)
+    return total[:, :, np.newaxis]
@@ -1,65 +1,216 @@
-import pickle
+"""
+Frame to frame association of peaks into tracks.
+
+Every track predicts its position with a constant velocity model.  Peaks are
+gated to the predicted positions through a KD-tree, which yields a sparse set
+of candidate pairs, and the pairs are resolved by optimal (minimum distance)
+assignment within each connected group of candidates.  Isolated pairs, the
+common case, are matched without solving anything, so a frame costs
+O(N log N) in the number of flies.
+
+Track life cycle:
+- An unmatched peak is born as a tentative track.
+- A track is confirmed once matched in `min_hits` consecutive frames.  Only
+  confirmed tracks are reported.
+- A tentative track dies on its first miss, a confirmed track after
+  `max_misses` consecutive misses.  While missing it coasts along its
+  velocity.
+"""
 import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from flysight.config import Config
+
+
+class FlyCentroidTracker:
+    """
+    :class FlyCentroidTracker:
+
+    The whole state of the tracker is its `tracks` array and `next_id`, which
+    `dump` packs into a compact binary context and `Load` unpacks again; a
+    header followed by one fixed size record per track.
+    """
+    VERSION = 1
+
+    HEADER = np.dtype([
+        ('version',  '<u4'),
+        ('next_id',  '<u4'),
+        ('count',    '<u4'),
+    ])
+
+    TRACK = np.dtype([
+        ('track_id', '<u4'),
+        ('row',      '<f4'),
+        ('col',      '<f4'),
+        ('drow',     '<f4'),
+        ('dcol',     '<f4'),
+        ('hits',     '<u2'),
+        ('misses',   '<u2'),
+    ])
+
+    # Counters saturate rather than wrap.
+    MAX_COUNT = np.iinfo(np.uint16).max
+
+    @staticmethod
+    def Load(data: bytes):
+        """
+        Restore a tracker from the context produced by `dump`.
+        """
+        header = np.frombuffer(data,
+                               dtype=FlyCentroidTracker.HEADER,
+                               count=1)[0]
+        if header['version'] != FlyCentroidTracker.VERSION:
+            raise ValueError('Unsupported tracking context version {}'.format(
+                                header['version']))
+
+        tracks = np.frombuffer(data,
+                               dtype=FlyCentroidTracker.TRACK,
+                               count=int(header['count']),
+                               offset=FlyCentroidTracker.HEADER.itemsize)
+        return FlyCentroidTracker(tracks.copy(), int(header['next_id']))
+
+    def __init__(self, tracks: np.array = None, next_id: int = 0):
+        config = Config.Instance.tracker
+        self.gate = config.gate
+        self.min_hits = config.min_hits
+        self.max_misses = config.max_misses
+        self.smoothing = config.smoothing
+
+        if tracks is None:
+            tracks = np.empty(0, dtype=self.TRACK)
+
+        self.tracks = tracks
+        self.next_id = next_id
+
+    def dump(self) -> bytes:
+        """
+        Binary context of the tracker.
+        """
+        header = np.array((self.VERSION, self.next_id, len(self.tracks)),
+                          dtype=self.HEADER)
+        return header.tobytes() + self.tracks.tobytes()
+
+    def nbytes(self) -> int:
+        """
+        Size of the tracker state, and of its context.
+        """
+        return self.HEADER.itemsize + self.tracks.nbytes
+
+    def update(self, peaks: np.array) -> np.array:
+        """
+        Advance the tracks by one frame of `peaks` ([N, 2] of row, col).
+        Returns the confirmed tracks matched in this frame, as `TRACK`
+        records.
+        """
+        peaks = np.asarray(peaks, dtype=np.float64).reshape(-1, 2)
+        tracks = self.tracks
+
+        predicted = np.stack([tracks['row'] + tracks['drow'],
+                              tracks['col'] + tracks['dcol']], axis=1)
+        (matched, assigned) = associate(predicted, peaks, self.gate)
+
+        # Matched tracks move onto their peak, the velocity follows the
+        # observed displacement.
+        velocity = np.stack([tracks['drow'], tracks['dcol']], axis=1)
+        displacement = peaks[assigned] - np.stack(
+                            [tracks['row'][matched], tracks['col'][matched]],
+                            axis=1)
+        velocity[matched] = self.smoothing * velocity[matched] \
+                          + (1. - self.smoothing) * displacement
+
+        position = predicted
+        position[matched] = peaks[assigned]
+
+        tracks['row'] = position[:, 0]
+        tracks['col'] = position[:, 1]
+        tracks['drow'] = velocity[:, 0]
+        tracks['dcol'] = velocity[:, 1]
+
+        hit = np.zeros(len(tracks), dtype=bool)
+        hit[matched] = True
+        tracks['hits'] = np.minimum(tracks['hits'] + hit, self.MAX_COUNT)
+        tracks['misses'] = np.where(
+                hit, 0, np.minimum(tracks['misses'] + 1, self.MAX_COUNT))
+
+        # Death; tentative tracks on their first miss, confirmed ones after
+        # `max_misses`.  As tentative tracks never miss, their hits are
+        # consecutive.
+        confirmed = tracks['hits'] >= self.min_hits
+        alive = hit | (confirmed & (tracks['misses'] <= self.max_misses))
+        tracks = tracks[alive]
+        hit = hit[alive]
+
+        # Birth; every unassigned peak starts a tentative track.
+        unassigned = np.ones(len(peaks), dtype=bool)
+        unassigned[assigned] = False
+
+        born = np.zeros(np.count_nonzero(unassigned), dtype=self.TRACK)
+        born['track_id'] = self.next_id + np.arange(len(born))
+        born['row'] = peaks[unassigned, 0]
+        born['col'] = peaks[unassigned, 1]
+        born['hits'] = 1
+        self.next_id += len(born)
+
+        self.tracks = np.concatenate([tracks, born])
+        hit = np.concatenate([hit, np.ones(len(born), dtype=bool)])
+
+        return self.tracks[hit & (self.tracks['hits'] >= self.min_hits)]
+
+
+def associate(
+        tracks: np.array, peaks: np.array, gate: float) -> (np.array, np.array):
+    """
+    Minimum total distance assignment of `peaks` to `tracks` (both [N, 2]),
+    where a pair is only admissible within the `gate` distance.  Returns the
+    indices of the matched tracks and of their assigned peaks.
+    """
+    empty = np.empty(0, dtype=np.intp)
+    if not len(tracks) or not len(peaks):
+        return (empty, empty)
+
+    # Admissible pairs, as (track, peak, distance) records.
+    pairs = cKDTree(tracks).sparse_distance_matrix(
+                cKDTree(peaks), gate, output_type='ndarray')
+    if not len(pairs):
+        return (empty, empty)
+
+    lhs = pairs['i'].astype(np.intp)
+    rhs = pairs['j'].astype(np.intp)
+    distance = pairs['v']
+
+    # Group the pairs by the connected component of the bipartite graph
+    # (tracks first, then peaks) they belong to.
+    nodes = len(tracks) + len(peaks)
+    graph = coo_matrix((np.ones(len(pairs)), (lhs, len(tracks) + rhs)),
+                       shape=(nodes, nodes))
+    (_, component) = connected_components(graph, directed=False)
+    component = component[lhs]
+
+    # A component of a single pair is matched as is.
+    single = np.bincount(component)[component] == 1
+    matched = [lhs[single]]
+    assigned = [rhs[single]]
+
+    # The others are contested, and each is solved on its own.
+    contested = np.flatnonzero(~single)
+    contested = contested[np.argsort(component[contested], kind='stable')]
+    bounds = np.flatnonzero(np.diff(component[contested])) + 1
+    for group in np.split(contested, bounds):
+        if not len(group):
+            continue
+
+        (rows, row_index) = np.unique(lhs[group], return_inverse=True)
+        (cols, col_index) = np.unique(rhs[group], return_inverse=True)
+
+        # Inadmissible pairs cost more than any admissible assignment.
+        cost = np.full((len(rows), len(cols)), (gate + 1.) * len(group))
+        cost[row_index, col_index] = distance[group]
 
-#def nearest_neighbor(value, array):
-#    #return np.argmin(np.linalg.norm(array - value))
-#    norms = np.linalg.norm(array - value, axis=1)
-#    index = np.argmin(norms)
-#    return (norms[index], index)
-#
-#print(nearest_neighbor(
-#      np.array([1., 1.1]),
-#      np.array([
-#          [1.00, 1.31],
-#          [1.00, 1.21],
-#          [1.10, 1.11]
-#      ])))
-#
-#
-#class FlyCentroidTrackerTrack:
-#    Id = 0
-#    def __init__(self, row, col):
-#        self.id  = self.Id
-#        self.row = row
-#        self.col = col
-#        self.Id += 1
-#
-#    def array(self):
-#        return np.array([self.row, self.col])
-#
-#class FlyCentroidTrackerContext:
-#    def __init__(self):
-#        self.tracks = []
-#
-#    def to_array(self):
-#        data = []
-#        for track in self.tracks:
-#            data.append((track.row, track.col))
-#        return np.array(data)
-#
-#class FlyCentroidTracker:
-#    @staticmethod
-#    def Load(data):
-#        return FlyCentroidTracker(pickle.loads(data))
-#
-#    def __init__(self, ctx=None):
-#        self.ctx = ctx or FlyCentroidTrackerContext()
-#
-#    def update_track(self, tracks):
-#        # Initialize the tracks.
-#        new_tracks = []
-#        for track in tracks:
-#            new_tracks.append((track.row, track.col))
-#
-#        new_tracks = np.array(new_tracks)
-#        old_tracks = ctx.tracks.to_array()
-#
-#        # Track
-#        for track in new_tracks:
-#            (value, index) = nearest_neighbor(track, old_tracks)
-#
-#
-#class K:
-#    pass
-#trck = FlyCentroidTrackerTrack()
+        (row, col) = linear_sum_assignment(cost)
+        admissible = cost[row, col] <= gate
+        matched.append(rows[row[admissible]])
+        assigned.append(cols[col[admissible]])
 
+    return (np.concatenate(matched), np.concatenate(assigned))
@@ -0,0 +1,157 @@
+"""
+A ring of frame/heatmap slots in named shared memory, used to move pixel data
+between a client and a server on the same host without copying it through a
+socket.  Only the ring name and a slot index travel in the protobuf message.
+
+Layout of the shared memory block:
+
+    +--------+-----------------+-------------------+-----------------+-----
+    | header | slot 0 frame    | slot 0 heatmap    | slot 1 frame    | ...
+    +--------+-----------------+-------------------+-----------------+-----
+
+The header records the geometry so that the attaching side needs nothing but
+the name.
+"""
+from collections import OrderedDict, namedtuple
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+# A slot within a ring, as passed to the `flysight.codec` functions.
+SharedSlot = namedtuple('SharedSlot', ['ring', 'slot'])
+
+
+class SharedRing:
+    """
+    :class SharedRing:
+
+    The creating side owns the shared memory and unlinks it on `close`.  Every
+    ring open in this process, created or attached, is kept in
+    `SharedRing.Attached`.  At most `MAX_ATTACHED` rings created elsewhere are
+    kept mapped; the least recently used are released beyond that, as their
+    owners may have long since unlinked them.
+    """
+    HEADER = np.dtype([
+        ('slots',         '<u8'),
+        ('frame_bytes',   '<u8'),
+        ('heatmap_bytes', '<u8'),
+    ])
+
+    # Regions of a slot.
+    FRAME = 0
+    HEATMAP = 1
+
+    # name -> SharedRing, for the rings attached by this process, least
+    # recently used first.
+    Attached = OrderedDict()
+    MAX_ATTACHED = 8
+
+    @staticmethod
+    def Create(slots: int, frame_bytes: int, heatmap_bytes: int):
+        """
+        Allocate a new ring of `slots` slots.
+        """
+        size = SharedRing.HEADER.itemsize \
+             + slots * (frame_bytes + heatmap_bytes)
+        memory = shared_memory.SharedMemory(create=True, size=size)
+
+        header = np.ndarray((), dtype=SharedRing.HEADER, buffer=memory.buf)
+        header['slots'] = slots
+        header['frame_bytes'] = frame_bytes
+        header['heatmap_bytes'] = heatmap_bytes
+        del header
+
+        ring = SharedRing(memory, owner=True)
+        SharedRing.Attached[ring.name] = ring
+        return ring
+
+    @staticmethod
+    def Attach(name: str):
+        """
+        Open (once) the ring created elsewhere under `name`.
+        """
+        if name in SharedRing.Attached:
+            SharedRing.Attached.move_to_end(name)
+            return SharedRing.Attached[name]
+
+        memory = shared_memory.SharedMemory(name=name)
+
+        # The resource tracker would otherwise unlink the block when this
+        # process exits, from under its owner.
+        resource_tracker.unregister(memory._name, 'shared_memory')
+
+        ring = SharedRing(memory, owner=False)
+        SharedRing.Attached[name] = ring
+        SharedRing.Evict()
+        return ring
+
+    @staticmethod
+    def Evict():
+        """
+        Release the least recently used rings created elsewhere, beyond
+        `MAX_ATTACHED`.  Rings still viewed by live arrays are kept.
+        """
+        attached = [ring for ring in SharedRing.Attached.values()
+                    if not ring.owner]
+        for ring in attached[:max(len(attached) - SharedRing.MAX_ATTACHED,
+                                  0)]:
+            try:
+                ring.close()
+            except BufferError:
+                SharedRing.Attached[ring.name] = ring
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        self.memory = memory
+        self.owner = owner
+
+        header = np.ndarray((), dtype=self.HEADER, buffer=memory.buf)
+        self.slots = int(header['slots'])
+        self.capacity = (int(header['frame_bytes']),
+                         int(header['heatmap_bytes']))
+        del header
+
+        if self.slots < 1 or memory.size < self.HEADER.itemsize \
+                + self.slots * sum(self.capacity):
+            memory.close()
+            raise ValueError('Malformed shared ring {}'.format(memory.name))
+
+        self.next_slot = 0
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def acquire(self) -> SharedSlot:
+        """
+        Hand out the next slot, round robin.  A slot is reused after `slots`
+        further acquisitions, so at most that many requests may be in flight.
+        """
+        slot = self.next_slot
+        self.next_slot = (self.next_slot + 1) % self.slots
+        return SharedSlot(self, slot)
+
+    def fits(self, region: int, nbytes: int) -> bool:
+        return nbytes <= self.capacity[region]
+
+    def view(self, slot: int, region: int, nbytes: int) -> memoryview:
+        """
+        Memory of the first `nbytes` of `region` in `slot`.  Raises ValueError
+        if there is no such slot or the region is too small, as the slot may
+        come from another process.
+        """
+        if not 0 <= slot < self.slots:
+            raise ValueError('Shared slot {} out of range'.format(slot))
+        if not self.fits(region, nbytes):
+            raise ValueError('Shared slot overflow')
+
+        offset = self.HEADER.itemsize + slot * sum(self.capacity) \
+               + sum(self.capacity[:region])
+        return self.memory.buf[offset:offset + nbytes]
+
+    def close(self):
+        """
+        Release the mapping, and the shared memory itself if owned.
+        """
+        SharedRing.Attached.pop(self.name, None)
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
@@ -0,0 +1,178 @@
+"""
+Random access, grayscale video decoding.
+
+Consecutive frames are read sequentially, without seeking.  Any other frame is
+reached by seeking to the nearest keyframe before it and decoding forward.
+With PyAV (optional) the keyframes come from an index of the packet timestamps.
+The index is built once per file by demuxing it, without decoding, and cached
+on disk.  Without PyAV, OpenCV does the seeking itself.
+"""
+import hashlib
+from os import makedirs, replace, stat
+from os.path import abspath, exists, join
+import cv2
+import numpy as np
+from flysight.config import Config
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+class VideoReader:
+    """
+    :class VideoReader:
+
+    Base of the readers.  `read` returns the frame at an index as a 2D uint8
+    grayscale image, or None past the end of the video.
+    """
+    @staticmethod
+    def Open(path: str):
+        """
+        Open `path` with the reader configured in `video.reader`; `pyav`,
+        `opencv` or `auto` (PyAV when installed).
+        """
+        reader = Config.Instance.video.reader
+        if reader == 'pyav' or (reader == 'auto' and av is not None):
+            return PyAvReader(path, Config.Instance.video.index_cache)
+        if reader in ('opencv', 'auto'):
+            return OpenCvReader(path)
+
+        raise ValueError('Unknown video reader: {}'.format(reader))
+
+    def __init__(self, path: str):
+        self.path = path
+        self.frame_count = 0
+        self.rows = 0
+        self.cols = 0
+
+        # Nominal frame rate, 0 if unknown.
+        self.fps = 0.
+
+        # Index of the frame a sequential read returns.
+        self.next_idx = 0
+
+    def read(self, frame_idx: int) -> np.array:
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class OpenCvReader(VideoReader):
+    """
+    :class OpenCvReader:
+    """
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.capture = cv2.VideoCapture(path)
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.rows = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.cols = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.fps = float(self.capture.get(cv2.CAP_PROP_FPS))
+
+    def read(self, frame_idx: int) -> np.array:
+        if frame_idx != self.next_idx:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+
+        (status, image) = self.capture.read()
+        if not status:
+            self.next_idx = -1
+            return None
+
+        self.next_idx = frame_idx + 1
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    def close(self):
+        self.capture.release()
+
+
+class PyAvReader(VideoReader):
+    """
+    :class PyAvReader:
+
+    Frames are numbered in presentation order; frame `i` has the `i`th
+    smallest timestamp of the stream.
+    """
+    def __init__(self, path: str, index_cache: str):
+        super().__init__(path)
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+
+        (self.pts, self.keyframes) = self.load_index(index_cache)
+        self.frame_count = len(self.pts)
+        self.rows = self.stream.codec_context.height
+        self.cols = self.stream.codec_context.width
+        if self.stream.average_rate:
+            self.fps = float(self.stream.average_rate)
+
+        self.frames = self.container.decode(self.stream)
+
+    def index_path(self, index_cache: str) -> str:
+        """
+        Index file of the video, keyed by its path, size and modification time
+        so that a changed video is indexed again.
+        """
+        info = stat(self.path)
+        key = '{}:{}:{}'.format(abspath(self.path), info.st_size, info.st_mtime)
+        return join(index_cache,
+                    hashlib.sha1(key.encode()).hexdigest() + '.index.npz')
+
+    def load_index(self, index_cache: str) -> (np.array, np.array):
+        """
+        The sorted timestamps of the frames, and the indices of the keyframes.
+        """
+        path = self.index_path(index_cache)
+        if exists(path):
+            with np.load(path) as index:
+                return (index['pts'], index['keyframes'])
+
+        pts = []
+        keys = []
+        for packet in self.container.demux(self.stream):
+            if packet.pts is None:
+                continue
+            pts.append(packet.pts)
+            if packet.is_keyframe:
+                keys.append(packet.pts)
+
+        pts = np.sort(np.array(pts, dtype=np.int64))
+        keyframes = np.searchsorted(pts, np.array(keys, dtype=np.int64))
+        self.container.seek(0)
+
+        makedirs(index_cache, exist_ok=True)
+        temporary = path + '.tmp.npz'
+        np.savez(temporary, pts=pts, keyframes=keyframes)
+        replace(temporary, path)
+
+        return (pts, keyframes)
+
+    def read(self, frame_idx: int) -> np.array:
+        if frame_idx < 0 or frame_idx >= self.frame_count:
+            return None
+
+        # Seek unless the frame lies ahead within the same group of pictures,
+        # where decoding forward is cheaper.
+        position = np.searchsorted(self.keyframes, frame_idx, side='right') - 1
+        keyframe = self.keyframes[position] if position >= 0 else 0
+        if not (self.next_idx <= frame_idx and keyframe <= self.next_idx):
+            self.container.seek(int(self.pts[keyframe]),
+                                stream=self.stream,
+                                backward=True)
+            self.frames = self.container.decode(self.stream)
+
+        target = self.pts[frame_idx]
+        for frame in self.frames:
+            if frame.pts is not None and frame.pts < target:
+                continue
+
+            self.next_idx = frame_idx + 1
+            return frame.to_ndarray(format='gray')
+
+        self.next_idx = -1
+        return None
+
+    def close(self):
+        self.container.close()
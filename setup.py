@@ -13,17 +13,25 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     install_requires=[
-        'matplotlib==3.3.0',
         'numpy==1.18.5',
         'opencv-python==4.4.0.42',
-        'protobuf==3.12.4',
+        'protobuf==3.20.3',
         'pyside2==5.14.0',
         'pyyaml==5.3.1',
         'pyzmq==19.0.2',
+        'scipy==1.5.2',
         'tensorflow==2.3.0',
     ],
+    extras_require={
+        'tflite': ['tflite-runtime'],
+        'onnx': ['onnxruntime', 'tf2onnx'],
+        'video': ['av'],
+    },
     entry_points = {
-        'console_scripts': ['flysight=flysight.run:main'],
+        'console_scripts': [
+            'flysight=flysight.run:main',
+            'flysight-batch=flysight.batch:main',
+        ],
     },
     data_files=[
 
@@ -35,6 +43,6 @@ setuptools.setup(
             'flysight/client/resource/slider.css'
         ]),
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.8',
     zip_safe=False,
 )
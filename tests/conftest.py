@@ -0,0 +1,84 @@
+"""
+Shared fixtures.  Tests run against the default configuration with an
+inference backend which needs no model.
+"""
+import socket
+from os.path import dirname, join
+import cv2
+import numpy as np
+import pytest
+import yaml
+from flysight.config import Config
+from flysight.server import solver
+from flysight.server.backend import Backend
+
+
+class FakeBackend(Backend):
+    """
+    :class FakeBackend:
+
+    A backend whose heatmap is the image itself, scaled to [0, 1].
+    """
+    def __init__(self, model_path: str = None, threads: int = None):
+        pass
+
+    def infer(self, X: np.array, upsample: bool) -> np.array:
+        Y = self.preprocess(X)
+        if upsample:
+            return self.postprocess(Y, X.shape[1:3])
+        return Y
+
+
+@pytest.fixture
+def config(tmp_path):
+    """
+    The default configuration, loaded into `Config.Instance`.
+    """
+    with open(join(dirname(__file__), '..', 'flysight', 'config.yml')) as fp:
+        data = yaml.safe_load(fp)
+    data['video']['index_cache'] = str(tmp_path)
+
+    Config.Instance = Config(data)
+    yield Config.Instance
+    Config.Instance = None
+
+
+@pytest.fixture
+def detector(config, monkeypatch):
+    """
+    A `FlyCentroidDetector` over `FakeBackend`.
+    """
+    monkeypatch.setattr(solver, 'fetch_model', lambda url, cache: None)
+    monkeypatch.setattr(Backend, 'Create',
+                        staticmethod(lambda name, path, threads: FakeBackend()))
+    return solver.FlyCentroidDetector()
+
+
+@pytest.fixture
+def free_port() -> int:
+    """
+    A TCP port of the loopback interface which nothing listens on.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def make_video():
+    """
+    A function writing a grayscale video of a bright square moving along the
+    diagonal.
+    """
+    return write_video
+
+
+def write_video(path: str, frames: int, rows: int, cols: int):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), 10,
+                             (cols, rows), False)
+    for frame_idx in range(frames):
+        image = np.zeros((rows, cols), dtype=np.uint8)
+        image[frame_idx * 4:frame_idx * 4 + 16,
+              frame_idx * 8:frame_idx * 8 + 16] = 255
+        writer.write(image)
+    writer.release()
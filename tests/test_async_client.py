@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+import zmq
+from flysight.client.async_client import AsyncClient
+from flysight.client.client import Client
+from flysight.server.main import serve
+
+
+def bind(port: int) -> zmq.Socket:
+    router = zmq.Context.instance().socket(zmq.ROUTER)
+    router.bind('tcp://127.0.0.1:{}'.format(port))
+    return router
+
+
+def test_results_in_order(detector, free_port):
+    port = free_port
+    threading.Thread(target=serve, args=(bind(port), detector),
+                     daemon=True).start()
+    uri = 'tcp://127.0.0.1:{}'.format(port)
+
+    images = []
+    for index in range(10):
+        image = np.zeros((96, 128), dtype=np.uint8)
+        image[index * 8:index * 8 + 8, 60:68] = 255
+        images.append(image)
+
+    expected = Client(uri)
+    expected.timeout_ms = 10000
+    peaks = [expected.detect(image)[1] for image in images]
+    expected.close()
+
+    async def detect_all():
+        client = AsyncClient(uri, window=4)
+        client.timeout_ms = 10000
+        results = [result async for result in client.detect_many(images)]
+        batched = [result async for result in client.detect_many(images, 3)]
+        client.close()
+        return (results, batched)
+
+    (results, batched) = asyncio.run(detect_all())
+    assert [result[1] for result in results] == peaks
+    assert [result[1] for result in batched] == peaks
+
+
+def test_receive_failure_fails_every_request(free_port):
+    port = free_port
+    router = bind(port)
+
+    def reply_malformed():
+        (identity, *_) = router.recv_multipart()
+        router.send_multipart([identity, b'truncated'])
+
+    threading.Thread(target=reply_malformed, daemon=True).start()
+
+    async def detect():
+        client = AsyncClient('tcp://127.0.0.1:{}'.format(port))
+        client.timeout_ms = 10000
+        image = np.zeros((8, 8), dtype=np.uint8)
+
+        with pytest.raises(ValueError):
+            await client.detect(image)
+        with pytest.raises(ConnectionError):
+            await client.detect(image)
+        client.close()
+
+    asyncio.run(detect())
+    router.close(linger=0)
@@ -0,0 +1,28 @@
+import urllib.request
+from os import listdir
+import pytest
+from flysight.server.backend import fetch_model
+
+
+def test_fetch_model_interrupted(tmp_path, monkeypatch):
+    def fail(url, path):
+        with open(path, 'wb') as fp:
+            fp.write(b'trunc')
+        raise ConnectionResetError(url)
+
+    monkeypatch.setattr(urllib.request, 'urlretrieve', fail)
+    with pytest.raises(ConnectionResetError):
+        fetch_model('http://model', str(tmp_path))
+    assert listdir(tmp_path) == []
+
+
+def test_fetch_model(tmp_path, monkeypatch):
+    def fetch(url, path):
+        with open(path, 'wb') as fp:
+            fp.write(b'model')
+
+    monkeypatch.setattr(urllib.request, 'urlretrieve', fetch)
+    path = fetch_model('http://model', str(tmp_path))
+    assert listdir(tmp_path) == ['model.h5']
+    with open(path, 'rb') as fp:
+        assert fp.read() == b'model'
@@ -0,0 +1,109 @@
+import json
+from argparse import Namespace
+from os.path import abspath, exists, join
+import numpy as np
+from flysight.batch import BatchJob, output_stems
+
+
+def arguments(**kwargs) -> Namespace:
+    args = Namespace(heatmaps=False, batch_size=4, checkpoint_every=5,
+                     restart=False)
+    vars(args).update(kwargs)
+    return args
+
+
+def read_peaks(path: str) -> [str]:
+    with open(path) as fp:
+        return fp.readlines()[1:]
+
+
+def test_output_stems_keep_directories(tmp_path):
+    videos = [str(tmp_path / 'a' / 'clip.mp4'),
+              str(tmp_path / 'b' / 'clip.mp4')]
+    assert output_stems(videos) == [join('a', 'clip'), join('b', 'clip')]
+    assert output_stems(videos[:1]) == ['clip']
+
+
+def test_videos_of_the_same_name(tmp_path, detector, make_video):
+    for directory in ('a', 'b'):
+        (tmp_path / directory).mkdir()
+    make_video(tmp_path / 'a' / 'clip.mp4', 12, 96, 128)
+    make_video(tmp_path / 'b' / 'clip.mp4', 7, 96, 128)
+
+    videos = [str(tmp_path / 'a' / 'clip.mp4'),
+              str(tmp_path / 'b' / 'clip.mp4')]
+    output = tmp_path / 'out'
+    for (video, stem) in zip(videos, output_stems(videos)):
+        BatchJob(video, str(output / stem), detector, arguments()).run()
+
+    for (directory, frames) in (('a', 12), ('b', 7)):
+        with open(output / directory / 'clip.checkpoint.json') as fp:
+            checkpoint = json.load(fp)
+        assert checkpoint['frames'] == frames
+        assert checkpoint['video'] == abspath(tmp_path / directory
+                                              / 'clip.mp4')
+
+        peaks = read_peaks(output / directory / 'clip.peaks.csv')
+        assert max(int(line.split(',')[0]) for line in peaks) == frames - 1
+
+
+def test_checkpoint_of_another_video_is_ignored(tmp_path, detector,
+                                                make_video):
+    make_video(tmp_path / 'clip.mp4', 12, 96, 128)
+    stem = str(tmp_path / 'out' / 'clip')
+    (tmp_path / 'out').mkdir()
+    with open(stem + '.checkpoint.json', 'w') as fp:
+        json.dump({'video': '/elsewhere/clip.mp4', 'frames': 12}, fp)
+
+    job = BatchJob(str(tmp_path / 'clip.mp4'), stem, detector, arguments())
+    assert job.start == 0
+    job.run()
+
+    with open(stem + '.checkpoint.json') as fp:
+        assert json.load(fp)['frames'] == 12
+
+
+def test_resume(tmp_path, detector, make_video):
+    make_video(tmp_path / 'clip.mp4', 12, 96, 128)
+    video = str(tmp_path / 'clip.mp4')
+    stem = str(tmp_path / 'clip')
+
+    BatchJob(video, stem, detector, arguments(restart=True)).run()
+    complete = read_peaks(stem + '.peaks.csv')
+
+    with open(stem + '.checkpoint.json', 'w') as fp:
+        json.dump({'video': abspath(video), 'frames': 5}, fp)
+    job = BatchJob(video, stem, detector, arguments())
+    assert job.start == 5
+    job.run()
+
+    assert read_peaks(stem + '.peaks.csv') == complete
+
+
+def test_heatmaps(tmp_path, detector, make_video):
+    make_video(tmp_path / 'clip.mp4', 6, 96, 128)
+    stem = str(tmp_path / 'clip')
+    BatchJob(str(tmp_path / 'clip.mp4'), stem, detector,
+             arguments(heatmaps=True)).run()
+
+    heatmaps = np.load(stem + '.heatmaps.npy')
+    assert heatmaps.shape == (6, 512, 512)
+    assert heatmaps.max() > 0
+
+
+def test_tiled_heatmaps(tmp_path, config, detector, make_video):
+    config.model.tiling.enabled = True
+    make_video(tmp_path / 'clip.mp4', 6, 304, 704)
+    stem = str(tmp_path / 'clip')
+    BatchJob(str(tmp_path / 'clip.mp4'), stem, detector,
+             arguments(heatmaps=True)).run()
+
+    heatmaps = np.load(stem + '.heatmaps.npy')
+    assert heatmaps.shape == (6, 304, 704)
+
+    # The fake heatmap is the frame; the square of frame 5 spans rows 20 to
+    # 35 and columns 40 to 55.
+    peaks = [line.split(',') for line in read_peaks(stem + '.peaks.csv')]
+    (row, col) = [float(value) for value in peaks[-1][2:]]
+    assert peaks[-1][0] == '5'
+    assert abs(row - 27.5) < 2 and abs(col - 47.5) < 2
@@ -0,0 +1,49 @@
+import threading
+import numpy as np
+import zmq
+from flysight.client.client import Client
+from flysight.server import broker
+from flysight.server.main import serve
+
+
+def start(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+
+
+def worker(uri: str, detector):
+    sock = zmq.Context.instance().socket(zmq.DEALER)
+    sock.connect(uri)
+    sock.send(broker.READY)
+    serve(sock, detector)
+
+
+def test_gated_stream_is_pinned(tmp_path, config, detector, free_port):
+    """
+    Inline (not zero copy) requests of a gated stream are all evaluated by
+    the same worker, so identical frames are evaluated once and the stream's
+    statistics are complete.
+    """
+    config.networking.port = free_port
+    config.server.workers.uri = 'ipc://{}'.format(tmp_path / 'workers')
+    config.server.gating.enabled = True
+
+    start(broker.main)
+    for _ in range(2):
+        start(worker, config.server.workers.uri, detector)
+
+    client = Client('tcp://127.0.0.1:{}'.format(config.networking.port))
+    client.zero_copy = False
+    client.timeout_ms = 10000
+
+    image = np.zeros((96, 128), dtype=np.uint8)
+    image[40:56, 60:76] = 255
+
+    # The first frame is evaluated on its own, as the frames of one batch
+    # are all looked up before any of them is evaluated.
+    results = list(client.detect_many([image], batch_size=1, depth=1))
+    results += client.detect_many([image] * 11, batch_size=1, depth=4)
+
+    assert len(results) == 12
+    assert client.statistics() == (11, 1)
+    client.close()
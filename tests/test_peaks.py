@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from flysight.server.peaks import find_peaks
+
+
+def heatmap(rows: int = 32, cols: int = 40) -> np.array:
+    return np.zeros((rows, cols), dtype=np.float32)
+
+
+def test_subpixel_refinement():
+    Y = heatmap()
+    Y[10, 20] = 1.
+    Y[10, 21] = .5
+    Y[11, 20] = .25
+
+    (row, col) = find_peaks(Y, 5, .1)[0] * Y.shape
+    assert row == pytest.approx(10 + .25 / 1.75)
+    assert col == pytest.approx(20 + .5 / 1.75)
+
+    (row, col) = find_peaks(Y, 5, .1, subpixel=False)[0] * Y.shape
+    assert (row, col) == (10, 20)
+
+
+def test_border_peak():
+    Y = heatmap()
+    Y[0, 0] = 1.
+    Y[0, 1] = 1. / 3
+
+    (row, col) = find_peaks(Y, 5, .1)[0] * Y.shape
+    assert row == pytest.approx(0)
+    assert col == pytest.approx(.25)
+
+
+def test_plateau_centroid():
+    Y = heatmap()
+    Y[10, 10:16] = 1.
+    Y[9, 10:16] = .5
+
+    peaks = find_peaks(Y, 5, .1) * Y.shape
+    np.testing.assert_allclose(peaks, [(10, 12.5)])
+
+
+def test_top_k():
+    Y = heatmap()
+    for (row, col, value) in ((4, 4, .5), (4, 30, 1.), (20, 8, .75),
+                              (26, 30, .25)):
+        Y[row, col] = value
+
+    peaks = find_peaks(Y, 5, .1, top_k=2) * Y.shape
+    np.testing.assert_allclose(peaks, [(4, 30), (20, 8)])
+    assert len(find_peaks(Y, 5, .1)) == 4
+    assert len(find_peaks(Y, 5, .1, top_k=8)) == 4
@@ -0,0 +1,76 @@
+import threading
+import numpy as np
+import pytest
+import zmq
+from flysight.client.client import Client
+from flysight.message_pb2 import Request
+from flysight.server.main import serve, split_envelope
+
+
+@pytest.fixture
+def client(detector, free_port):
+    router = zmq.Context.instance().socket(zmq.ROUTER)
+    router.bind('tcp://127.0.0.1:{}'.format(free_port))
+    threading.Thread(target=serve, args=(router, detector),
+                     daemon=True).start()
+
+    client = Client('tcp://127.0.0.1:{}'.format(free_port))
+    client.timeout_ms = 10000
+    yield client
+    client.close()
+
+
+def request(client: Client, req: Request) -> list:
+    client.socket.send(req.SerializeToString())
+    return client.receive()
+
+
+def test_malformed_tracking_requests(client):
+    """
+    Tracking requests whose heatmap is missing are answered with an error,
+    and the server keeps serving.
+    """
+    req = Request()
+    req.tracking.heatmap.rows = 8
+    req.tracking.heatmap.cols = 8
+    req.tracking.heatmap.frame = 3
+    with pytest.raises(RuntimeError, match='ERROR'):
+        request(client, req)
+
+    req.tracking.heatmap.shared_memory = 'flysight-missing'
+    with pytest.raises(RuntimeError, match='ERROR'):
+        request(client, req)
+
+    req = Request()
+    req.tracking.context = b'\x00'
+    with pytest.raises(RuntimeError, match='ERROR'):
+        request(client, req)
+
+    image = np.zeros((64, 64), dtype=np.uint8)
+    image[20:28, 30:38] = 255
+    (_, peaks) = client.detect(image)
+    assert len(peaks) == 1
+
+
+
+def test_detect_many_error_reply(free_port):
+    """
+    A batch the server rejects raises the server's error.
+    """
+    router = zmq.Context.instance().socket(zmq.ROUTER)
+    router.bind('tcp://127.0.0.1:{}'.format(free_port))
+
+    def reject():
+        message = router.recv_multipart()
+        (envelope, _) = split_envelope(message)
+        router.send_multipart(envelope + [b'ERROR: rejected'])
+
+    threading.Thread(target=reject, daemon=True).start()
+
+    client = Client('tcp://127.0.0.1:{}'.format(free_port))
+    client.timeout_ms = 10000
+    with pytest.raises(RuntimeError, match='rejected'):
+        list(client.detect_many([np.zeros((8, 8), dtype=np.uint8)]))
+
+    client.close()
+    router.close(linger=0)
@@ -0,0 +1,106 @@
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pytest
+from flysight.shared_ring import SharedRing
+
+
+@pytest.fixture
+def foreign():
+    """
+    Create shared memory blocks as another process would, holding a ring
+    header of the given geometry.
+    """
+    blocks = []
+
+    def create(slots: int, frame_bytes: int, heatmap_bytes: int,
+               size: int = None) -> str:
+        if size is None:
+            size = SharedRing.HEADER.itemsize \
+                 + slots * (frame_bytes + heatmap_bytes)
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        header = np.ndarray((), dtype=SharedRing.HEADER, buffer=memory.buf)
+        header['slots'] = slots
+        header['frame_bytes'] = frame_bytes
+        header['heatmap_bytes'] = heatmap_bytes
+        del header
+        blocks.append(memory)
+        return memory.name
+
+    yield create
+
+    for ring in list(SharedRing.Attached.values()):
+        ring.close()
+    for memory in blocks:
+        memory.close()
+        # `Attach` unregistered the block from the resource tracker.
+        resource_tracker.register(memory._name, 'shared_memory')
+        memory.unlink()
+
+
+def test_create_attach(foreign):
+    ring = SharedRing.Create(2, 16, 8)
+    assert SharedRing.Attach(ring.name) is ring
+    ring.close()
+    assert ring.name not in SharedRing.Attached
+
+    name = foreign(2, 16, 8)
+    ring = SharedRing.Attach(name)
+    assert not ring.owner
+    assert (ring.slots, ring.capacity) == (2, (16, 8))
+    assert [ring.acquire().slot for _ in range(3)] == [0, 1, 0]
+
+    view = ring.view(1, SharedRing.HEATMAP, 8)
+    view[:] = bytes(range(8))
+    memory = shared_memory.SharedMemory(name=name)
+    offset = SharedRing.HEADER.itemsize + 16 + 8 + 16
+    assert bytes(memory.buf[offset:offset + 8]) == bytes(range(8))
+    view.release()
+    memory.close()
+
+
+def test_view_bounds(foreign):
+    ring = SharedRing.Attach(foreign(2, 16, 8))
+    with pytest.raises(ValueError, match='out of range'):
+        ring.view(2, SharedRing.FRAME, 16)
+    with pytest.raises(ValueError, match='out of range'):
+        ring.view(-1, SharedRing.FRAME, 16)
+    with pytest.raises(ValueError, match='overflow'):
+        ring.view(0, SharedRing.HEATMAP, 9)
+
+
+@pytest.mark.parametrize('geometry', [(0, 16, 8), (4, 16, 8, 64)])
+def test_malformed_header(foreign, geometry):
+    name = foreign(*geometry)
+    with pytest.raises(ValueError, match='Malformed'):
+        SharedRing.Attach(name)
+    assert name not in SharedRing.Attached
+
+
+def test_attached_lru(foreign):
+    owned = SharedRing.Create(1, 8, 8)
+    names = [foreign(1, 8, 8) for _ in range(SharedRing.MAX_ATTACHED + 2)]
+    rings = [SharedRing.Attach(name) for name in names[:-2]]
+
+    # Using the oldest ring makes the second oldest the first evicted.
+    SharedRing.Attach(names[0])
+    SharedRing.Attach(names[-2])
+    assert names[1] not in SharedRing.Attached
+    assert rings[1].memory.buf is None
+
+    # Rings still viewed are kept, beyond the limit.
+    assert [ring.name for ring in SharedRing.Attached.values()
+            if not ring.owner][0] == names[2]
+    view = rings[2].view(0, SharedRing.FRAME, 8)
+    SharedRing.Attach(names[-1])
+    assert names[2] in SharedRing.Attached
+
+    attached = [ring.name for ring in SharedRing.Attached.values()
+                if not ring.owner]
+    assert len(attached) == SharedRing.MAX_ATTACHED + 1
+    assert owned.name in SharedRing.Attached
+
+    # It was kept as the most recently used.
+    view.release()
+    SharedRing.Evict()
+    assert names[2] in SharedRing.Attached
+    assert names[3] not in SharedRing.Attached
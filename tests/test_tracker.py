@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+from flysight.server.session import SessionStore
+from flysight.server.tracker import FlyCentroidTracker, associate
+
+
+def frames(count: int) -> [np.array]:
+    """
+    The peaks of two flies moving apart diagonally, normalized to the frame.
+    """
+    return [np.array([[0.2 + 0.005 * index, 0.2 + 0.005 * index],
+                      [0.8 - 0.005 * index, 0.5]])
+            for index in range(count)]
+
+
+def track_ids(tracks: np.array) -> [int]:
+    return sorted(int(track_id) for track_id in tracks['track_id'])
+
+
+def test_context_round_trip(config):
+    tracker = FlyCentroidTracker()
+    tracker.update(frames(1)[0])
+
+    restored = FlyCentroidTracker.Load(tracker.dump())
+    assert restored.next_id == tracker.next_id
+    assert restored.tracks.tobytes() == tracker.tracks.tobytes()
+    assert len(tracker.dump()) == tracker.nbytes()
+
+
+def test_malformed_context(config):
+    with pytest.raises(ValueError):
+        FlyCentroidTracker.Load(b'\x00')
+
+    context = bytearray(FlyCentroidTracker().dump())
+    context[0] = 99
+    with pytest.raises(ValueError):
+        FlyCentroidTracker.Load(bytes(context))
+
+
+def test_track_ids_are_stable_across_contexts(config):
+    """
+    Tracks are confirmed after `min_hits` frames and keep their ID while the
+    context is passed from frame to frame.
+    """
+    context = None
+    reported = []
+    for peaks in frames(8):
+        tracker = FlyCentroidTracker() if context is None \
+                else FlyCentroidTracker.Load(context)
+        reported.append(tracker.update(peaks))
+        context = tracker.dump()
+
+    min_hits = config.tracker.min_hits
+    assert all(len(tracks) == 0 for tracks in reported[:min_hits - 1])
+    assert all(track_ids(tracks) == [0, 1]
+               for tracks in reported[min_hits - 1:])
+
+    # Each ID follows its own fly.
+    last = reported[-1]
+    first = last[last['track_id'] == 0][0]
+    assert (first['row'], first['col']) == pytest.approx((0.235, 0.235))
+
+
+def test_gate(config):
+    """
+    A peak beyond the gate of every track is a new track, and the missed
+    track coasts until it dies.
+    """
+    tracker = FlyCentroidTracker()
+    for _ in range(config.tracker.min_hits):
+        tracker.update([[0.5, 0.5]])
+
+    jump = 0.5 + 2 * config.tracker.gate
+    for _ in range(config.tracker.max_misses + 1):
+        tracks = tracker.update([[jump, 0.5]])
+        assert 0 not in tracks['track_id']
+
+    assert track_ids(tracker.tracks) == [1]
+
+
+def test_contested_association():
+    """
+    Two tracks within the gate of both peaks get the assignment of least
+    total distance.
+    """
+    tracks = np.array([[0.50, 0.50], [0.50, 0.52]])
+    peaks = np.array([[0.50, 0.525], [0.50, 0.505]])
+    (matched, assigned) = associate(tracks, peaks, 0.05)
+    assert dict(zip(matched, assigned)) == {0: 1, 1: 0}
+
+    (matched, assigned) = associate(tracks, np.empty((0, 2)), 0.05)
+    assert len(matched) == len(assigned) == 0
+
+
+def test_sessions(config):
+    sessions = SessionStore()
+    assert sessions.snapshot('a') is None
+
+    for peaks in frames(4):
+        sessions.get('a').update(peaks)
+    context = sessions.snapshot('a')
+
+    # A restored session carries on with the same IDs.
+    sessions.restore('b', context)
+    tracks = sessions.get('b').update(frames(5)[-1])
+    assert track_ids(tracks) == [0, 1]
+
+    sessions.close('a')
+    assert sessions.snapshot('a') is None
+    assert sessions.snapshot('b') is not None
+
+
+def test_session_eviction(config):
+    config.tracker.sessions.max_bytes = 1
+    sessions = SessionStore()
+    sessions.get('a').update(frames(1)[0])
+    sessions.get('b')
+
+    # The most recently used session is always kept.
+    assert sessions.snapshot('a') is None
+    assert sessions.snapshot('b') is not None